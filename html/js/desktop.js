@@ -373,6 +373,17 @@ function Desktop(elements) {
         ws.close()
     }
 
+    this.unblockUI = function () {
+        $('body').find('.screen-disconnected').remove()
+        $('body').css('overflow', '')
+        $('#wrapper').css('z-index', '')
+        $('#plugins-library').css('z-index', '')
+        $('#cloud-plugins-library').css('z-index', '')
+        $('#pedalboards-library').css('z-index', '')
+        $('#bank-library').css('z-index', '')
+        $('#main-menu').css('z-index', '')
+    }
+
     this.init = function () {
         $(".mod-init-hidden").removeClass("mod-init-hidden");
         $("body").addClass("initialized");
@@ -8,32 +8,96 @@ var cached_cpuLoad = null,
     pb_loading     = true
 
 $('document').ready(function() {
-    ws = new WebSocket("ws://" + window.location.host + "/websocket")
-
     var empty    = false,
         modified = false;
     var dataReadyCounter = '',
-        dataReadyTimeout = null;
+        dataReadyFrame = null;
+    var binaryPorts = {};
+    // last "seq" received, used to resume after a dropped connection
+    var resyncEpoch = null,
+        resyncSeq   = null,
+        reconnecting = false,
+        reconnectAttempts = 0;
+
+    function connect () {
+        binaryPorts = {}
+
+        var url = "ws://" + window.location.host + "/websocket"
+        if (resyncSeq !== null) {
+            url += "?epoch=" + resyncEpoch + "&seq=" + resyncSeq
+        }
+        // "mod-binary" makes param_set and output_set values arrive as binary frames, see mod/webclient.py
+        ws = new WebSocket(url, "mod-binary")
+        ws.binaryType = "arraybuffer"
+        ws.onclose = onClose
+        ws.onmessage = onMessage
+    }
+
+    connect()
 
-    function triggerDelayedReadyResponse (triggerNew) {
-        if (dataReadyTimeout) {
-            clearTimeout(dataReadyTimeout)
-            triggerNew = true
+    // reply on the next animation frame, after the values received so far have been drawn.
+    // hidden tabs get no frames and stop replying, the server then stops waiting for them
+    function triggerReadyResponse () {
+        if (dataReadyFrame) {
+            return
         }
-        if (triggerNew) {
-            dataReadyTimeout = setTimeout(function() {
-                dataReadyTimeout = null
+        dataReadyFrame = requestAnimationFrame(function() {
+            dataReadyFrame = null
+            if (ws.readyState == WebSocket.OPEN) {
                 ws.send("data_ready " + dataReadyCounter)
-            }, 50)
+            }
+        })
+    }
+
+    // binary frame: message type (uint8) followed by a list of port index (uint16) and value (float32)
+    function handleBinaryMessage (buffer) {
+        var view = new DataView(buffer)
+        var type = view.getUint8(0)
+        var method = (type == 1) ? "setPortWidgetsValue" : "setOutputPortValue"
+        var port
+
+        for (var i = 1; i+6 <= buffer.byteLength; i += 6) {
+            port = binaryPorts[view.getUint16(i, true)]
+            if (port) {
+                desktop.pedalboard.pedalboard(method, port[0], port[1], view.getFloat32(i+2, true));
+            }
         }
     }
 
-    ws.onclose = function () {
-        desktop && desktop.blockUI()
+    function onClose () {
+        // give up if we never got a "seq", the UI was blocked on purpose or the server is not coming back
+        if (resyncSeq === null || reconnectAttempts >= 5 || (!reconnecting && $('body').find('.screen-disconnected').length != 0)) {
+            reconnecting = false
+            desktop && desktop.blockUI()
+            return
+        }
+
+        if (!reconnecting) {
+            reconnecting = true
+            desktop && desktop.blockUI()
+        }
+
+        reconnectAttempts++
+        setTimeout(connect, 1000)
     }
 
-    ws.onmessage = function (evt) {
+    function onMessage (evt) {
+        if (typeof evt.data !== "string") {
+            handleBinaryMessage(evt.data)
+            return
+        }
+
         var data = evt.data
+
+        // several messages joined together, used for the initial state and to send a message along with its "seq"
+        if (data.substr(0, 6) == "batch\0") {
+            var msgs = data.split("\0")
+            for (var i = 1; i < msgs.length; i++) {
+                onMessage({ data: msgs[i] })
+            }
+            return
+        }
+
         var cmd = data.split(" ",1)
 
         if (!cmd.length) {
@@ -48,6 +112,7 @@ $('document').ready(function() {
             return
         }
         if (cmd == "stop") {
+            resyncSeq = null
             desktop.blockUI()
             return
         }
@@ -55,13 +120,38 @@ $('document').ready(function() {
             desktop.ccDeviceUpdateFinished()
             return
         }
+        if (cmd == "resync_failed") {
+            // missed too much while disconnected, start over
+            location.reload()
+            return
+        }
 
         // everything from here onwards has at least 1 argument
         data = data.substr(cmd.length+1);
 
+        if (cmd == "seq") {
+            data = data.split(" ",2)
+            resyncEpoch = data[0]
+            resyncSeq   = data[1]
+            if (reconnecting) {
+                reconnecting = false
+                reconnectAttempts = 0
+                desktop.unblockUI()
+            }
+            return
+        }
+
+        if (cmd == "bin_ports") {
+            data = data.split(" ")
+            for (var i = 0; i+2 < data.length; i += 3) {
+                binaryPorts[data[i]] = [data[i+1], data[i+2]]
+            }
+            return
+        }
+
         if (cmd == "data_ready") {
             dataReadyCounter = data
-            triggerDelayedReadyResponse(true)
+            triggerReadyResponse()
             return
         }
 
@@ -75,8 +165,6 @@ $('document').ready(function() {
             return
         }
 
-        triggerDelayedReadyResponse(false)
-
         if (cmd == "stats") {
             data        = data.split(" ",2)
             var cpuLoad = parseFloat(data[0])
@@ -136,6 +224,14 @@ $('document').ready(function() {
             return
         }
 
+        if (cmd == "output_set_multi") {
+            data = data.split(" ")
+            for (var i = 0; i+2 < data.length; i += 3) {
+                desktop.pedalboard.pedalboard("setOutputPortValue", data[i], data[i+1], parseFloat(data[i+2]));
+            }
+            return
+        }
+
         if (cmd == "patch_set") {
             var sdata     = data.split(" ",4)
             var instance  = sdata[0]
@@ -168,6 +168,19 @@ def get_unique_name(name, names):
     return name
 
 
+def combine_callbacks(callback1, callback2):
+    if callback1 is None:
+        return callback2
+    if callback2 is None:
+        return callback1
+
+    def callback(resp):
+        callback1(resp)
+        callback2(resp)
+
+    return callback
+
+
 def normalize_for_hw(string, limit = 31):
     return '"%s"' % (
         normalize('NFKD',string).encode('ascii','ignore').decode('ascii','ignore').replace('"','')[:limit].upper()
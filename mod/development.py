@@ -2,10 +2,15 @@
 # SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
-import logging
+import logging, os, random, time, tty
+from collections import deque
+from tornado.concurrent import Future
 from tornado.ioloop import IOLoop
+from tornado.iostream import PipeIOStream, StreamClosedError
+from tornado.tcpserver import TCPServer
 from mod.hmi import HMI
 from mod.host import Host
+from mod.mod_protocol import CMD_RESPONSE
 
 class FakeHMI(HMI):
     def __init__(self, init_cb):
@@ -38,6 +43,9 @@ class FakeSocket(object):
     def read_until(self, msg, callback):
         return
 
+    def read_bytes(self, num_bytes, callback, partial=False):
+        return
+
 class FakeHost(Host):
     def __del__(self):
         self.readsock = None
@@ -62,12 +70,223 @@ class FakeHost(Host):
             self.memtimer.start()
 
     # send data to host, set modified flag to true
-    def send_modified(self, msg, callback=None, datatype='int'):
+    def send_modified(self, msg, callback=None, datatype='int', coalesce=None):
         self.pedalboard_modified = True
         if callback is not None:
             callback(True)
 
     # send data to host, don't change modified flag
-    def send_notmodified(self, msg, callback=None, datatype='int'):
+    def send_notmodified(self, msg, callback=None, datatype='int', coalesce=None):
         if callback is not None:
             callback(True)
+
+# Preferences with nothing stored, every value is the default
+class FakePreferences(object):
+    def get(self, key, default, type_ = None, values = None):
+        return default
+
+    def setAndSave(self, key, value, atomicSave = True):
+        return
+
+# Stand-in for mod-host, listening on `port` for commands and `port+1` for feedback.
+# Commands are handled one at a time in order, like mod-host does, and answered with "resp 0" after a delay.
+# Used to benchmark the mod-host protocol code without audio hardware, see test/host-benchmark.py
+class FakeModHost(object):
+    def __init__(self, port, latency=0.0, verb_latency=None):
+        self.port = port
+        # seconds per command, optionally different for each command verb
+        self.latency = latency
+        self.verb_latency = verb_latency or {}
+        self.received = 0
+        self.verbs = {}
+        self.feedback = None
+
+        host = self
+
+        class CommandServer(TCPServer):
+            def handle_stream(self, stream, address):
+                host.handle_command_stream(stream)
+
+        class FeedbackServer(TCPServer):
+            def handle_stream(self, stream, address):
+                host.feedback = stream
+
+        self.servers = (CommandServer(), FeedbackServer())
+
+    def start(self):
+        self.servers[0].listen(self.port, "127.0.0.1")
+        self.servers[1].listen(self.port+1, "127.0.0.1")
+
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+
+    def handle_command_stream(self, stream):
+        pending = deque()
+        busy = [False]
+
+        def reply():
+            msg = pending.popleft()
+            try:
+                stream.write(b"resp 0\0")
+                if msg == "output_data_ready" and self.feedback is not None:
+                    self.feedback.write(b"data_finish\0")
+            except StreamClosedError:
+                return
+            process_next()
+
+        def process_next():
+            if len(pending) == 0:
+                busy[0] = False
+                return
+
+            busy[0] = True
+            verb = pending[0].split(" ",1)[0]
+            latency = self.verb_latency.get(verb, self.latency)
+
+            if latency > 0.0:
+                IOLoop.instance().call_later(latency, reply)
+            else:
+                IOLoop.instance().add_callback(reply)
+
+        def received(data):
+            msg = data[:-1].decode("utf-8", errors="ignore")
+            verb = msg.split(" ",1)[0]
+            self.received += 1
+            self.verbs[verb] = self.verbs.get(verb, 0) + 1
+
+            pending.append(msg)
+            if not busy[0]:
+                process_next()
+
+            read()
+
+        def read():
+            try:
+                stream.read_until(b"\0", received)
+            except StreamClosedError:
+                pass
+
+        read()
+
+# Simulated HMI on a pseudo-terminal, mod-ui can use its path as MOD_HMI_SERIAL_PORT.
+# Messages from mod-ui are answered one at a time, like the real firmware does.
+# Quirks: drop_rate is the chance of never answering a message, split_replies writes each answer in 2 parts.
+class FakeHMIDevice(object):
+    def __init__(self, latency=0.0, cmd_latency=None, drop_rate=0.0, split_replies=False):
+        # seconds per message, optionally different for each command
+        self.latency = latency
+        self.cmd_latency = cmd_latency or {}
+        self.drop_rate = drop_rate
+        self.split_replies = split_replies
+        self.received = 0
+        self.dropped = 0
+        self.cmds = {}
+        self.last_received = 0.0
+        # commands sent to mod-ui and waiting for a reply, as (future, time sent)
+        self.waiting = deque()
+        self.pending = deque()
+        self.busy = False
+        self.stream = None
+        # data held back while a split reply is being written
+        self.held = None
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+
+    def start(self):
+        self.stream = PipeIOStream(self.master)
+        self.read()
+
+    def stop(self):
+        self.stream.close()
+        os.close(self.slave)
+
+    # Send a command to mod-ui, as if coming from the HMI.
+    # Resolves to (reply, seconds until the reply arrived).
+    def send_command(self, msg):
+        future = Future()
+        self.waiting.append((future, time.monotonic()))
+        self.write(msg.encode("utf-8") + b"\0")
+        return future
+
+    def write(self, data):
+        if self.held is not None:
+            self.held.append(data)
+            return
+        try:
+            self.stream.write(data)
+        except StreamClosedError:
+            pass
+
+    def read(self):
+        try:
+            self.stream.read_until(b"\0", self.received_data)
+        except StreamClosedError:
+            pass
+
+    def received_data(self, data):
+        msg = data[:-1].decode("utf-8", errors="ignore")
+        cmd = msg.split(" ",1)[0]
+
+        if cmd == CMD_RESPONSE:
+            try:
+                future, sent = self.waiting.popleft()
+            except IndexError:
+                logging.error("[fake-hmi] unexpected reply %s", msg)
+            else:
+                future.set_result((msg, time.monotonic() - sent))
+
+        else:
+            self.received += 1
+            self.cmds[cmd] = self.cmds.get(cmd, 0) + 1
+            self.last_received = time.monotonic()
+
+            self.pending.append(cmd)
+            if not self.busy:
+                self.process_next()
+
+        self.read()
+
+    def process_next(self):
+        if len(self.pending) == 0:
+            self.busy = False
+            return
+
+        self.busy = True
+        latency = self.cmd_latency.get(self.pending[0], self.latency)
+
+        if latency > 0.0:
+            IOLoop.instance().call_later(latency, self.reply)
+        else:
+            IOLoop.instance().add_callback(self.reply)
+
+    def reply(self):
+        self.pending.popleft()
+
+        if self.drop_rate > 0.0 and random.random() < self.drop_rate:
+            self.dropped += 1
+
+        else:
+            data = ("%s 0" % CMD_RESPONSE).encode("utf-8") + b"\0"
+
+            if self.split_replies:
+                self.write(data[:2])
+                self.held = [data[2:]]
+                IOLoop.instance().call_later(0.001, self.write_held)
+                return
+
+            self.write(data)
+
+        self.process_next()
+
+    # second part of a split reply, and anything sent meanwhile
+    def write_held(self):
+        held = self.held
+        self.held = None
+
+        for data in held:
+            self.write(data)
+
+        self.process_next()
@@ -2,12 +2,14 @@
 # SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
+from collections import deque
 from datetime import timedelta
 from tornado.iostream import BaseIOStream, StreamClosedError
 from tornado.ioloop import IOLoop
 from unicodedata import normalize
 
-from mod import get_hardware_actuators, get_hardware_descriptor, get_nearest_valid_scalepoint_value, normalize_for_hw
+from mod import combine_callbacks, get_hardware_actuators, get_hardware_descriptor, get_nearest_valid_scalepoint_value, normalize_for_hw
+from mod.metrics import counter, histogram
 from mod.protocol import Protocol, ProtocolError, process_resp
 from mod.mod_protocol import (
     CMD_PING,
@@ -62,6 +64,28 @@ try:
 except ImportError:
     haveSerial = False
 
+# Messages that only set state on the HMI, sending them again gives the same result.
+# With a window bigger than 1 several of these can be waiting for a reply at once,
+# any other message is only sent when nothing else is in flight.
+HMI_WINDOW_MESSAGES = frozenset((
+    CMD_CONTROL_ADD,
+    CMD_CONTROL_SET,
+    CMD_DUO_CONTROL_INDEX_SET,
+    CMD_MENU_ITEM_CHANGE,
+    CMD_PEDALBOARD_NAME_SET,
+    CMD_SNAPSHOT_NAME_SET,
+    CMD_TUNER,
+))
+
+# response time covers the serial link and the HMI firmware, callback time is spent in mod-ui
+HMI_RESPONSE_SECONDS = histogram("mod_hmi_response_seconds", "Time the HMI took to reply to a message", ("cmd",))
+HMI_CALLBACK_SECONDS = histogram("mod_hmi_callback_seconds", "Time spent handling HMI replies", ("cmd",))
+HMI_COMMAND_SECONDS = histogram("mod_hmi_command_seconds", "Time taken to reply to commands from the HMI", ("cmd",))
+HMI_BYTES = counter("mod_hmi_bytes_total", "Bytes written to or read from the HMI serial port", ("direction",))
+HMI_COALESCED = counter("mod_hmi_coalesced_total", "Messages to the HMI replaced by a newer one before being sent")
+HMI_FLUSHES = counter("mod_hmi_flushes_total", "Times the HMI queue was flushed and the serial port reopened", ("reason",))
+HMI_FLUSHED_MESSAGES = counter("mod_hmi_flushed_messages_total", "Messages to the HMI dropped by a flush")
+
 class SerialIOStream(BaseIOStream):
     def __init__(self, sp):
         self.sp = sp
@@ -75,9 +99,12 @@ class SerialIOStream(BaseIOStream):
 
     def write_to_fd(self, data):
         try:
-            return self.sp.write(data)
+            written = self.sp.write(data)
         except serial.SerialTimeoutException:
             return 0
+        if written:
+            HMI_BYTES.inc(written, ("sent",))
+        return written
 
     def read_from_fd(self):
         try:
@@ -87,24 +114,122 @@ class SerialIOStream(BaseIOStream):
             return None
         if r == '':
             return None
+        if r:
+            HMI_BYTES.inc(len(r), ("received",))
         return r
 
+class HMIMessageQueue(object):
+    def __init__(self):
+        self.entries = deque()
+        # number of messages dropped because a newer one replaced them
+        self.coalesced = 0
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.entries.clear()
+        # live (not replaced) messages
+        self.count = 0
+        # coalesce key -> entry, only for messages not sent yet
+        self.keys = {}
+
+    # A message with the same coalesce key as one still waiting to be sent replaces it.
+    # The newer message goes to the end of the queue, so ordering with other messages is kept.
+    # Entries are lists of [msg, callback, datatype, coalesce]
+    def put(self, msg, callback, datatype):
+        coalesce = self.get_coalesce_key(msg)
+
+        if coalesce is not None:
+            entry = self.keys.get(coalesce, None)
+
+            if entry is not None:
+                self.coalesced += 1
+                self.count -= 1
+                HMI_COALESCED.inc()
+                if LOG >= 2:
+                    logging.debug("[hmi] dropped from queue: %s", entry[0])
+
+                # the previous message is skipped, its callback receives the newest response
+                entry[0] = None
+                callback = combine_callbacks(entry[1], callback)
+
+        entry = [msg, callback, datatype, coalesce]
+        if coalesce is not None:
+            self.keys[coalesce] = entry
+
+        self.count += 1
+        self.entries.append(entry)
+
+    # returns the first (msg, callback, datatype) without removing it, raises IndexError if empty
+    def first(self):
+        while len(self.entries) != 0:
+            entry = self.entries[0]
+
+            # replaced by a newer message
+            if entry[0] is None:
+                self.entries.popleft()
+                continue
+
+            return (entry[0], entry[1], entry[2])
+
+        raise IndexError("queue is empty")
+
+    # returns the first (msg, callback, datatype) and removes it from the queue, raises IndexError if empty
+    def popleft(self):
+        while len(self.entries) != 0:
+            msg, callback, datatype, coalesce = self.entries.popleft()
+
+            # replaced by a newer message
+            if msg is None:
+                continue
+
+            if coalesce is not None:
+                self.keys.pop(coalesce, None)
+
+            self.count -= 1
+            return (msg, callback, datatype)
+
+        raise IndexError("pop from an empty queue")
+
+    # only the latest control value, profile value and tuner state matter to the HMI
+    def get_coalesce_key(self, msg):
+        args = msg.split(" ")
+        cmd  = args[0]
+
+        # control_set <hw_id> <value>
+        if cmd == CMD_CONTROL_SET and len(args) == 3:
+            return (cmd, args[1])
+
+        # menu_item_change <key> <value>, messages with several key/value pairs are left alone
+        if cmd == CMD_MENU_ITEM_CHANGE and len(args) == 3:
+            return (cmd, args[1])
+
+        # tuner <freq> <note> <cents>
+        if cmd == CMD_TUNER:
+            return (cmd,)
+
+        return None
+
 class HMI(object):
     def __init__(self, port, baud_rate, timeout, init_cb, reinit_cb):
         self.sp = None
         self.port = port
         self.baud_rate = baud_rate
-        self.queue = []
-        self.queue_idle = True
+        self.queue = HMIMessageQueue()
+        # messages sent and waiting for a reply, as [msg, callback, datatype, time sent]
+        self.inflight = deque()
         self.initialized = False
         self.connected = False
         self.handling_response = False
         self.need_flush = 0 # 0 means False, otherwise use it as counter
         self.flush_io = None
-        self.last_write_time = 0
         self.timeout = timeout # in seconds
         self.reinit_cb = reinit_cb
         self.hw_desc = get_hardware_descriptor()
+        # how many messages the HMI firmware can take before replying, 1 means one at a time
+        self.window = max(1, int(self.hw_desc.get('hmi_window', 1)))
         hw_actuators = self.hw_desc.get('actuators', [])
         self.hw_ids = [actuator['id'] for actuator in hw_actuators]
         self.bpm = None
@@ -122,7 +247,8 @@ class HMI(object):
             ioloop.call_later(1, callback)
             return
 
-        virtual = self.port.startswith("/dev/ttyHMI")
+        # socat links and pseudo-terminals have no real modem lines
+        virtual = self.port.startswith("/dev/ttyHMI") or self.port.startswith("/dev/pts/")
 
         try:
             sp = None
@@ -158,8 +284,8 @@ class HMI(object):
         def call_ping():
             sp.flushInput()
             sp.flushOutput()
-            self.queue = []
-            self.queue_idle = True
+            self.queue.clear()
+            self.inflight.clear()
 
             self.ping(ping_callback)
             self.ping_io = ioloop.call_later(1, call_ping)
@@ -171,7 +297,6 @@ class HMI(object):
         ioloop = IOLoop.instance()
 
         if data is not None and data != b'\0':
-            self.last_write_time = 0
             try:
                 msg = Protocol(data.decode("utf-8", errors="ignore"))
             except ProtocolError as e:
@@ -187,7 +312,7 @@ class HMI(object):
 
                 if msg.is_resp():
                     try:
-                        original_msg, callback, datatype = self.queue.pop(0)
+                        original_msg, callback, datatype, sent = self.inflight.popleft()
                         withlog = LOG >= 2 or (LOG and original_msg not in ("pi",))
                         if withlog:
                             logging.debug('[hmi] received response <- %s', data)
@@ -197,13 +322,20 @@ class HMI(object):
                         # something is wrong / not synced!!
                         logging.error("[hmi] NOT SYNCED after receiving %s", data)
                     else:
+                        labels = (cmd_to_str(original_msg.split(" ",1)[0]),)
+                        now = time.monotonic()
+                        HMI_RESPONSE_SECONDS.observe(now - sent, labels)
                         if callback is not None:
                             if withlog:
                                 logging.debug("[hmi] calling callback for %s", original_msg)
                             callback(msg.process_resp(datatype))
+                            HMI_CALLBACK_SECONDS.observe(time.monotonic() - now, labels)
                         self.process_queue()
                 else:
+                    received = time.monotonic()
+
                     def _callback(resp, resp_args=None):
+                        HMI_COMMAND_SECONDS.observe(time.monotonic() - received, (cmd_to_str(msg.cmd),))
                         if not isinstance(resp, int):
                             resp = 0 if resp else -1
                         if resp_args is None:
@@ -215,8 +347,7 @@ class HMI(object):
                             logging.debug('[hmi]     sent "%s %d %s"', CMD_RESPONSE, resp, resp_args)
 
                         self.handling_response = False
-                        if self.queue_idle:
-                            self.process_queue()
+                        self.process_queue()
 
                     if LOG >= 1:
                         logging.debug('[hmi] received <- %s | %s', data,
@@ -238,23 +369,36 @@ class HMI(object):
     def flush(self, forced = False):
         prev_queue = self.need_flush
         self.need_flush = 0
+        pending = len(self.queue) + len(self.inflight)
 
-        if len(self.queue) < max(5, prev_queue) and not forced:
+        if pending < max(5, prev_queue) and not forced:
             logging.debug("[hmi] flushing ignored")
             return
 
         # FUCK!
-        logging.warn("[hmi] flushing queue as workaround now: %d in queue", len(self.queue))
+        logging.warn("[hmi] flushing queue as workaround now: %d in queue", pending)
         self.sp.sp.flush()
         self.sp.sp.flushInput()
         self.sp.sp.flushOutput()
         self.sp.close()
         self.sp = None
 
-        while len(self.queue) > 1:
-            msg, callback, datatype = self.queue.pop(0)
+        # everything but the most recent message fails, in flight or not
+        failed = []
+        if len(self.queue) != 0:
+            while len(self.inflight) != 0:
+                failed.append(self.inflight.popleft()[:3])
+            while len(self.queue) > 1:
+                failed.append(self.queue.popleft())
+        else:
+            while len(self.inflight) > 1:
+                failed.append(self.inflight.popleft()[:3])
+
+        HMI_FLUSHES.inc(labels=("timeout" if forced else "queue",))
+        HMI_FLUSHED_MESSAGES.inc(len(failed))
 
-            if any(msg.startswith(resp) for resp in Protocol.RESPONSES):
+        for msg, callback, datatype in failed:
+            if msg.startswith(Protocol.RESPONSES):
                 if callback is not None:
                     callback(process_resp(None, datatype))
             else:
@@ -269,24 +413,43 @@ class HMI(object):
         if self.sp is None:
             return
 
-        try:
-            msg, callback, datatype = self.queue[0] # fist msg on the queue
-        except IndexError:
-            if LOG >= 2:
-                logging.debug("[hmi] queue is empty, nothing to do")
-            self.queue_idle = True
-            self.last_write_time = 0
-        else:
+        while len(self.inflight) < self.window:
+            try:
+                msg, callback, datatype = self.queue.first() # fist msg on the queue
+            except IndexError:
+                if LOG >= 2 and len(self.inflight) == 0:
+                    logging.debug("[hmi] queue is empty, nothing to do")
+                return
+
+            cmd = msg.split(" ",1)[0]
+
+            if len(self.inflight) != 0:
+                if cmd not in HMI_WINDOW_MESSAGES or self.inflight[-1][0].split(" ",1)[0] not in HMI_WINDOW_MESSAGES:
+                    return
+
+            self.queue.popleft()
+
             if LOG >= 2 or (LOG and msg not in ("pi",)):
-                logging.debug("[hmi] sending -> %s | %s", msg, cmd_to_str(msg.split(" ",1)[0]))
+                logging.debug("[hmi] sending -> %s | %s", msg, cmd_to_str(cmd))
             try:
                 self.sp.write(msg.encode('utf-8') + b'\0')
             except StreamClosedError as e:
                 logging.exception(e)
                 self.sp = None
 
-            self.queue_idle = False
-            self.last_write_time = time.time()
+            self.inflight.append([msg, callback, datatype, time.monotonic()])
+
+            if self.sp is None:
+                return
+
+    def get_stats(self):
+        return {
+            'queued': len(self.queue),
+            'inflight': len(self.inflight),
+            'window': self.window,
+            'coalesced': self.queue.coalesced,
+            'oldest_inflight': time.monotonic() - self.inflight[0][3] if len(self.inflight) != 0 else 0.0,
+        }
 
     def reply_protocol_error(self, error):
         #self.send(error) # TODO: proper error handling, needs to be implemented by HMI
@@ -297,27 +460,27 @@ class HMI(object):
             return
 
         if self.timeout > 0:
-            if len(self.queue) > 30:
-                self.need_flush = len(self.queue)
+            if len(self.queue) + len(self.inflight) > 30:
+                self.need_flush = len(self.queue) + len(self.inflight)
 
-            elif self.last_write_time != 0 and time.time() - self.last_write_time > self.timeout:
+            elif len(self.inflight) != 0 and time.monotonic() - self.inflight[0][3] > self.timeout:
                 logging.warn("[hmi] no response for %ds, giving up", self.timeout)
                 if self.flush_io is not None:
                     IOLoop.instance().remove_timeout(self.flush_io)
                     self.flush_io = None
                 self.flush(True)
 
-        if not any([ msg.startswith(resp) for resp in Protocol.RESPONSES ]):
+        if not msg.startswith(Protocol.RESPONSES):
             # make an exception for control_set, calling callback right away without waiting
             #if msg.startswith("s "):
                 #self.queue.append((msg, None, datatype))
                 #if callback is not None:
                     #callback(True)
             #else:
-            self.queue.append((msg, callback, datatype))
+            self.queue.put(msg, callback, datatype)
             if LOG >= 2 or (LOG and msg not in ("pi",)):
                 logging.debug("[hmi] scheduling -> %s | %s", msg, cmd_to_str(msg.split(" ",1)[0]))
-            if self.queue_idle and not self.handling_response:
+            if not self.handling_response:
                 self.process_queue()
             return
 
@@ -16,7 +16,8 @@ This will start the mainloop and will handle the callbacks and the async functio
 """
 
 from base64 import b64encode
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import timedelta
 from random import randint
 from tornado import gen, iostream
@@ -33,7 +34,7 @@ except ImportError:
 
 from mod import (
     TextFileFlusher,
-    get_hardware_descriptor, get_nearest_valid_scalepoint_value, get_unique_name,
+    combine_callbacks, get_hardware_descriptor, get_nearest_valid_scalepoint_value, get_unique_name,
     read_file_contents, safe_json_load, normalize_for_hw, os_sync, symbolify
 )
 from mod.addressings import Addressings
@@ -121,6 +122,7 @@ from mod.mod_protocol import (
     MENU_ID_TOP,
     menu_item_id_to_str,
 )
+from mod.metrics import histogram
 from mod.profile import (
     Profile,
     apply_mixer_values,
@@ -130,7 +132,8 @@ from mod.protocol import (
     Protocol, ProtocolError, process_resp,
 )
 from mod.settings import (
-    LOG, DEFAULT_PEDALBOARD, DEVICE_HOST_PORT,
+    LOG, DEFAULT_PEDALBOARD, DEVICE_HOST_PORT, HOST_PIPELINE_WINDOW, HOST_SLOW_COMMAND_THRESHOLD,
+    OUTPUT_DATA_READY_MIN_INTERVAL, OUTPUT_DATA_READY_MAX_INTERVAL,
     DATA_DIR, LV2_PEDALBOARDS_DIR, LV2_PLUGIN_DIR, LV2_FACTORY_PEDALBOARDS_DIR, USER_FILES_DIR,
     PEDALBOARD_INSTANCE, PEDALBOARD_INSTANCE_ID, PEDALBOARD_URI, PEDALBOARD_TMP_DIR,
     TUNER_URI, TUNER_INSTANCE_ID, TUNER_INPUT_PORT, TUNER_MONITOR_PORT, HMI_TIMEOUT, MODEL_TYPE,
@@ -203,6 +206,13 @@ CV_PREFIX = 'cv_'
 CV_OPTION = '/cv'
 HW_CV_PREFIX = CV_OPTION + '/graph/' + CV_PREFIX
 
+HOST_COMMAND_SECONDS = histogram("mod_host_command_seconds", "Time mod-host took to reply to a command", ("verb",))
+HOST_QUEUE_SECONDS = histogram("mod_host_queue_seconds", "Time a command waited in mod-ui before being sent to mod-host",
+                               ("verb",))
+PEDALBOARD_LOAD_SECONDS = histogram("mod_pedalboard_load_seconds",
+                                    "Time from starting a pedalboard load until mod-host has all its plugins and connections")
+PEDALBOARD_SAVE_SECONDS = histogram("mod_pedalboard_save_seconds", "Time taken to save a pedalboard, including plugin state")
+
 # TODO: check pluginData['designations'] when doing addressing
 # TODO: hmi_save_current_pedalboard does not send browser msgs, needed?
 # TODO: finish presets, testing
@@ -298,6 +308,175 @@ class InstanceIdMapper(object):
     def get_instance(self, id):
         return self.id_map[id]
 
+# class to group several mod-host messages, sent in order with nothing else in between
+class HostCommandBatch(object):
+    def __init__(self, callback=None):
+        self.msgs = []
+        self.callbacks = []
+        self.datatypes = []
+        self.responses = []
+        # (start, end, callback) for nested batches merged into this one
+        self.groups = []
+        # called with the list of all responses once the last one arrives
+        self.callback = callback
+
+    def __len__(self):
+        return len(self.msgs)
+
+    def add(self, msg, callback, datatype):
+        self.msgs.append(msg)
+        self.callbacks.append(callback)
+        self.datatypes.append(datatype)
+
+    def merge(self, batch):
+        start = len(self.msgs)
+        self.msgs.extend(batch.msgs)
+        self.callbacks.extend(batch.callbacks)
+        self.datatypes.extend(batch.datatypes)
+
+        for gstart, gend, callback in batch.groups:
+            self.groups.append((start + gstart, start + gend, callback))
+
+        if batch.callback is not None:
+            self.groups.append((start, len(self.msgs), batch.callback))
+
+    # process the response for the next message, returns True if the batch is now complete
+    def process_response(self, resp):
+        callback = self.callbacks[len(self.responses)]
+        self.responses.append(resp)
+
+        if callback is not None:
+            callback(resp)
+
+        count = len(self.responses)
+
+        while len(self.groups) != 0 and self.groups[0][1] == count:
+            start, end, callback = self.groups.pop(0)
+            callback(self.responses[start:end])
+
+        if count != len(self.msgs):
+            return False
+
+        if self.callback is not None:
+            self.callback(self.responses)
+        return True
+
+    # reply to all messages still waiting for a response with an error
+    def abort(self):
+        for datatype in self.datatypes[len(self.responses):]:
+            self.process_response(process_resp(None, datatype))
+
+# write queue for mod-host messages, split in lanes by priority
+class HostCommandQueue(object):
+    LANE_INTERACTIVE  = 0
+    LANE_DEFAULT      = 1
+    LANE_HOUSEKEEPING = 2
+
+    HOUSEKEEPING_MESSAGES = ("output_data_ready", "cpu_load")
+
+    def __init__(self):
+        self.lanes = (deque(), deque(), deque())
+        # number of messages dropped because a newer one replaced them
+        self.coalesced = 0
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        for lane in self.lanes:
+            lane.clear()
+        # live (not replaced) messages
+        self.count = 0
+        # coalesce key -> entry
+        self.keys = {}
+        # instance id -> number of messages in the default lane that touch it
+        self.pending = {}
+
+    # Interactive messages (the ones with a coalesce key) go before everything else,
+    # unless a message for the same plugin is still pending in the default lane, in which case order is kept.
+    # Entries are lists of [msg, callback, datatype, coalesce, instance ids, time queued]
+    def put(self, msg, callback, datatype, coalesce=None):
+        if coalesce is not None:
+            entry = self.keys.get(coalesce, None)
+
+            if entry is not None:
+                self.coalesced += 1
+                self.count -= 1
+                if LOG >= 2:
+                    logging.debug("[host] dropped from queue: %s", entry[0])
+
+                # the previous message is skipped when popped, its callback receives the newest response
+                entry[0] = None
+                callback = combine_callbacks(entry[1], callback)
+
+        if isinstance(msg, HostCommandBatch):
+            instances = set(self.get_instance_id(bmsg) for bmsg in msg.msgs)
+            instances.discard(None)
+            lane = self.LANE_DEFAULT
+        else:
+            instance = self.get_instance_id(msg)
+            instances = (instance,) if instance is not None else ()
+
+            if msg in self.HOUSEKEEPING_MESSAGES:
+                lane = self.LANE_HOUSEKEEPING
+            elif coalesce is not None and self.pending.get(-1, 0) == 0 and self.pending.get(instance, 0) == 0:
+                lane = self.LANE_INTERACTIVE
+            else:
+                lane = self.LANE_DEFAULT
+
+        if lane == self.LANE_DEFAULT:
+            for instance in instances:
+                self.pending[instance] = self.pending.get(instance, 0) + 1
+        else:
+            instances = ()
+
+        entry = [msg, callback, datatype, coalesce, instances, time.monotonic()]
+        if coalesce is not None:
+            self.keys[coalesce] = entry
+
+        self.count += 1
+        self.lanes[lane].append(entry)
+
+    # returns the next (msg, callback, datatype, time queued), raises IndexError if empty
+    def popleft(self):
+        for lane in self.lanes:
+            while len(lane) != 0:
+                msg, callback, datatype, coalesce, instances, queued = lane.popleft()
+
+                for instance in instances:
+                    count = self.pending[instance] - 1
+                    if count == 0:
+                        del self.pending[instance]
+                    else:
+                        self.pending[instance] = count
+
+                # replaced by a newer message
+                if msg is None:
+                    continue
+
+                if coalesce is not None:
+                    self.keys.pop(coalesce, None)
+
+                self.count -= 1
+                return (msg, callback, datatype, queued)
+
+        raise IndexError("pop from an empty queue")
+
+    def get_instance_id(self, msg):
+        args = msg.split(" ", 2)
+        if len(args) < 2:
+            return None
+
+        # add <uri> <instance_id>
+        if args[0] == "add":
+            args[1] = msg.rsplit(" ", 1)[1]
+
+        try:
+            return int(args[1])
+        except ValueError:
+            return None
+
 class Host(object):
     DESIGNATIONS_INDEX_ENABLED   = 0
     DESIGNATIONS_INDEX_FREEWHEEL = 1
@@ -305,6 +484,12 @@ class Host(object):
     DESIGNATIONS_INDEX_BPM       = 3
     DESIGNATIONS_INDEX_SPEED     = 4
 
+    # web client messages that are not part of the web state cache (sent separately in `report_current_state`)
+    WEB_STATE_IGNORED_MESSAGES = (
+        "stats", "sys_stats", "data_ready", "ping", "stop", "log", "transport", "truebypass", "size", "bufsize",
+        "loading_end", "cc-device-updated", "rescan", "hw_add", "hw_rem", "hw_con", "hw_dis",
+    )
+
     # HMI snapshots, reusing the same code for pedalboard snapshots but with reserved negative numbers
     HMI_SNAPSHOTS_OFFSET = 100
     HMI_SNAPSHOTS_1      = 0 - (HMI_SNAPSHOTS_OFFSET + 0)
@@ -321,9 +506,30 @@ class Host(object):
         self.writesock = None
         self.crashed = False
         self.connected = False
-        self._queue = []
+        self._queue = HostCommandQueue()
+        self._inflight = deque()
+        # [batch, index of the next message to send, withlog, waited] for a batch that is partially sent
+        self._batch = None
+        self._last_response_time = 0.0
+        # most recent commands that took longer than HOST_SLOW_COMMAND_THRESHOLD
+        self.slow_commands = deque(maxlen=50)
+        self._reading = False
         self._idle = True
+        self._bulk = None
+        self._readbuf = bytearray()
+        self.pipeline_window = HOST_PIPELINE_WINDOW
         self.profile_applied = False
+
+        # handlers for mod-host feedback messages, only a few of these are coroutines
+        self.read_message_handlers = {
+            "param_set": self.process_read_param_set,
+            "output_set": self.process_read_output_set,
+            "patch_set": self.process_read_patch_set,
+            "midi_mapped": self.process_read_midi_mapped,
+            "midi_program_change": self.process_read_midi_program_change,
+            "transport": self.process_read_transport,
+            "log": self.process_read_log,
+        }
         self.hmi_ping_io = None
 
         self.addressings = Addressings()
@@ -352,6 +558,22 @@ class Host(object):
         self.web_connected = False
         self.web_data_ready_counter = 0
         self.web_data_ready_ok = True
+        # time the current "data_ready" was sent
+        self.web_data_ready_time = 0.0
+        # clients waited for on the current "data_ready", and clients that replied to it
+        self.web_data_ready_clients = set()
+        self.web_data_ready_replies = set()
+        self.web_data_ready_timeout = None
+        # average time web clients take to reply to "data_ready"
+        self.web_data_ready_latency = OUTPUT_DATA_READY_MIN_INTERVAL
+        # output port values received since the last data_finish, (instance, symbol) -> value
+        self.pending_outputs = OrderedDict()
+        # cached messages for new web clients, see `update_web_state`
+        self.web_state = None
+        self.web_state_index = {}
+        # (kind, instance, symbol) -> latest value, applied to `web_state` when the payload is built
+        self.web_state_values = {}
+        self.web_state_payload = None
 
         self.alluserpedalboards = None
         self.allfactorypedalboards = None
@@ -1224,6 +1446,10 @@ class Host(object):
             }
         }
 
+    # a reconnecting websocket client can skip the full state only if mod-host kept running meanwhile
+    def can_resync(self):
+        return self.readsock is not None and self.writesock is not None and not self.crashed
+
     def open_connection_if_needed(self, websocket):
         if self.readsock is not None and self.writesock is not None:
             self.report_current_state(websocket)
@@ -1248,7 +1474,12 @@ class Host(object):
                 self.process_postponed_messages()
 
         self._idle = False
-        self._queue = []
+        self._queue.clear()
+        self._inflight.clear()
+        self._batch = None
+        self._reading = False
+        self._readbuf = bytearray()
+        self.pending_outputs.clear()
 
         # Main socket, used for sending messages
         self.writesock = iostream.IOStream(socket.socket(socket.AF_INET, socket.SOCK_STREAM))
@@ -1276,15 +1507,32 @@ class Host(object):
 
         self.msg_callback("stop")
 
+        # messages already sent will never get a response now
+        while self._inflight:
+            msg, callback, datatype = self._inflight.popleft()[:3]
+            logging.debug("[host] popped from in-flight queue: %s", msg)
+
+            if callback is not None:
+                callback(process_resp(None, datatype))
+
+        if self._batch is not None:
+            self._batch[0].abort()
+            self._batch = None
+
+        self._reading = False
+
         while True:
             try:
-                msg, callback, datatype = self._queue.pop(0)
-                logging.debug("[host] popped from queue: %s", msg)
+                msg, callback, datatype, _ = self._queue.popleft()
             except IndexError:
                 self._idle = True
                 break
 
-            if callback is not None:
+            logging.debug("[host] popped from queue: %s", msg)
+
+            if isinstance(msg, HostCommandBatch):
+                msg.abort()
+            elif callback is not None:
                 callback(process_resp(None, datatype))
 
         IOLoop.instance().call_later(5, self.reconnect_jack)
@@ -1547,6 +1795,8 @@ class Host(object):
         self.web_connected = True
         self.web_data_ready_counter = 0
         self.web_data_ready_ok = True
+        self.web_data_ready_clients = set()
+        self.web_data_ready_replies = set()
         self.send_output_data_ready(None, None)
 
         self.alluserpedalboards = []
@@ -1580,6 +1830,9 @@ class Host(object):
         self.userbanks = list_banks(baduserbundles, True, False)
 
         self.web_connected = False
+        if self.web_data_ready_timeout is not None:
+            IOLoop.instance().remove_timeout(self.web_data_ready_timeout)
+            self.web_data_ready_timeout = None
         if not self.web_data_ready_ok:
             self.web_data_ready_ok = True
             self.send_output_data_ready(None, None)
@@ -1608,263 +1861,317 @@ class Host(object):
     # -----------------------------------------------------------------------------------------------------------------
     # Message handling
 
+    # handle everything read from the feedback socket in one go, messages are NUL-terminated
+    def process_read_data(self, data):
+        self._readbuf += data
+        msgs = self._readbuf.split(b"\0")
+        # last item is an incomplete message (or empty)
+        self._readbuf = bytearray(msgs.pop())
+
+        # a bad message must never stop reading, otherwise all feedback is lost until restart
+        for msg in msgs:
+            try:
+                self.process_read_message(msg)
+            except Exception as e:
+                logging.exception(e)
+
+        self.process_read_queue()
+
     def process_read_message(self, msg):
-        msg = msg[:-1].decode("utf-8", errors="ignore")
+        msg = msg.decode("utf-8", errors="ignore")
         # NOTE: "data_finis" is intentional
         if LOG >= 2 or (LOG and msg[:msg.find(' ')] not in ("data_finis","output_set")):
             logging.debug("[host] received <- %s", repr(msg))
 
         self.process_read_message_body(msg)
-        self.process_read_queue()
 
-    @gen.coroutine
     def process_read_message_body(self, msg):
-        ioloop = IOLoop.instance()
-
         if msg == "data_finish":
-            if self.web_connected:
-                self.web_data_ready_ok = False
-                self.web_data_ready_counter += 1
-                self.msg_callback("data_ready %i" % self.web_data_ready_counter)
-                return
+            self.process_read_data_finish()
+            return
 
-            now  = ioloop.time()
-            diff = now-self.last_data_finish_msg
+        cmd, _, data = msg.partition(" ")
 
-            if diff >= 0.5:
-                try:
-                    yield gen.Task(self.send_output_data_ready, now)
-                except Exception as e:
-                    logging.exception(e)
+        try:
+            handler = self.read_message_handlers[cmd]
+        except KeyError:
+            logging.error("[host] unrecognized command: %s", cmd)
+            return
 
-            elif self.last_data_finish_handle is None:
-                if diff < 0.2:
-                    diff = 0.2
-                else:
-                    diff = 0.5-diff
-                self.last_data_finish_handle = ioloop.call_later(diff, self.send_output_data_ready_later)
+        handler(data)
 
-            else:
-                logging.warning("[host] data_finish ignored")
+    def process_read_data_finish(self):
+        self.flush_pending_outputs()
 
+        ioloop = IOLoop.instance()
+
+        if self.web_connected:
+            self.web_data_ready_ok = False
+            self.web_data_ready_counter += 1
+            self.web_data_ready_time = ioloop.time()
+            # wait for the clients that replied to the previous "data_ready", others are behind and are only
+            # waited for again once they reply in time
+            self.web_data_ready_clients = self.web_data_ready_replies
+            self.web_data_ready_replies = set()
+            if self.web_data_ready_timeout is not None:
+                ioloop.remove_timeout(self.web_data_ready_timeout)
+            self.web_data_ready_timeout = ioloop.call_later(OUTPUT_DATA_READY_MAX_INTERVAL,
+                                                            self.web_data_ready_expired)
+            self.msg_callback("data_ready %i" % self.web_data_ready_counter)
             return
 
-        cmd, data = msg.split(" ",1)
+        now  = ioloop.time()
+        diff = now-self.last_data_finish_msg
 
-        if cmd == "param_set":
-            msg_data    = data.split(" ",3)
-            instance_id = int(msg_data[0])
-            portsymbol  = msg_data[1]
-            value       = float(msg_data[2])
+        if diff >= 0.5:
+            self.send_output_data_ready(now, None)
 
-            try:
-                instance   = self.mapper.get_instance(instance_id)
-                pluginData = self.plugins[instance_id]
-            except:
-                pass
+        elif self.last_data_finish_handle is None:
+            if diff < 0.2:
+                diff = 0.2
             else:
-                if portsymbol == ":bypass":
-                    pluginData['bypassed'] = bool(value)
+                diff = 0.5-diff
+            self.last_data_finish_handle = ioloop.call_later(diff, self.send_output_data_ready_later)
 
-                elif portsymbol == ":presets":
-                    abort_catcher = self.abort_previous_loading_progress("process_read_message_body")
-                    value = int(value)
-                    if value < 0 or value >= len(pluginData['mapPresets']):
-                        return
+        else:
+            logging.warning("[host] data_finish ignored")
 
-                    try:
-                        if instance_id == PEDALBOARD_INSTANCE_ID:
-                            value = int(pluginData['mapPresets'][value].replace("file:///",""))
-                            yield gen.Task(self.snapshot_load_gen_helper, value, False, abort_catcher)
-                        else:
-                            yield gen.Task(self.preset_load_gen_helper, instance, pluginData['mapPresets'][value], False, abort_catcher)
-                    except Exception as e:
-                        logging.exception(e)
+    def process_read_param_set(self, data):
+        msg_data    = data.split(" ",3)
+        instance_id = int(msg_data[0])
+        portsymbol  = msg_data[1]
+        value       = float(msg_data[2])
 
-                else:
-                    pluginData['ports'][portsymbol] = value
+        try:
+            instance   = self.mapper.get_instance(instance_id)
+            pluginData = self.plugins[instance_id]
+        except:
+            return
 
-                    if instance_id == PEDALBOARD_INSTANCE_ID:
-                        self.process_read_message_pedal_changed(portsymbol, value)
+        if portsymbol == ":bypass":
+            pluginData['bypassed'] = bool(value)
 
-                self.pedalboard_modified = True
-                self.msg_callback("param_set %s %s %f" % (instance, portsymbol, value))
+        elif portsymbol == ":presets":
+            self.process_read_param_set_presets(instance_id, instance, pluginData, value)
+            return
 
-        elif cmd == "output_set":
-            msg_data    = data.split(" ",3)
-            instance_id = int(msg_data[0])
-            portsymbol  = msg_data[1]
-            value       = float(msg_data[2])
+        else:
+            pluginData['ports'][portsymbol] = value
 
-            if instance_id == TUNER_INSTANCE_ID:
-                self.set_tuner_value(value)
+            if instance_id == PEDALBOARD_INSTANCE_ID:
+                self.process_read_message_pedal_changed(portsymbol, value)
 
-            else:
-                try:
-                    instance   = self.mapper.get_instance(instance_id)
-                    pluginData = self.plugins[instance_id]
-                except:
-                    pass
-                else:
-                    pluginData['outputs'][portsymbol] = value
-                    self.msg_callback("output_set %s %s %f" % (instance, portsymbol, value))
+        self.pedalboard_modified = True
+        self.msg_callback("param_set %s %s %f" % (instance, portsymbol, value))
 
-        elif cmd == "patch_set":
-            msg_data     = data.split(" ",3)
-            instance_id  = int(msg_data[0])
-            parameteruri = msg_data[1]
-            valuetype    = msg_data[2]
-            valuedata    = msg_data[3]
+    @gen.coroutine
+    def process_read_param_set_presets(self, instance_id, instance, pluginData, value):
+        abort_catcher = self.abort_previous_loading_progress("process_read_message_body")
+        value = int(value)
+        if value < 0 or value >= len(pluginData['mapPresets']):
+            return
 
-            try:
-                instance   = self.mapper.get_instance(instance_id)
-                pluginData = self.plugins[instance_id]
-            except:
-                pass
+        try:
+            if instance_id == PEDALBOARD_INSTANCE_ID:
+                value = int(pluginData['mapPresets'][value].replace("file:///",""))
+                yield gen.Task(self.snapshot_load_gen_helper, value, False, abort_catcher)
             else:
-                parameter = pluginData['parameters'].get(parameteruri, None)
-                if parameter is not None:
-                    if valuetype == 'p' and not valuedata.startswith(USER_FILES_DIR) and os.path.islink(valuedata):
-                        valuedata = os.path.realpath(valuedata)
-                    parameter[0] = valuedata
-                    writable = 1
-                else:
-                    writable = 0
-                self.msg_callback("patch_set %s %d %s %s %s" % (instance, writable, parameteruri, valuetype, valuedata))
-
-        elif cmd == "midi_mapped":
-            msg_data    = data.split(" ",7)
-            instance_id = int(msg_data[0])
-            portsymbol  = msg_data[1]
-            channel     = int(msg_data[2])
-            controller  = int(msg_data[3])
-            value       = float(msg_data[4])
-            minimum     = float(msg_data[5])
-            maximum     = float(msg_data[6])
+                yield gen.Task(self.preset_load_gen_helper, instance, pluginData['mapPresets'][value], False, abort_catcher)
+        except Exception as e:
+            logging.exception(e)
+
+        self.pedalboard_modified = True
+        self.msg_callback("param_set %s :presets %f" % (instance, value))
+
+    def process_read_output_set(self, data):
+        msg_data    = data.split(" ",3)
+        instance_id = int(msg_data[0])
+        portsymbol  = msg_data[1]
+        value       = float(msg_data[2])
 
+        if instance_id == TUNER_INSTANCE_ID:
+            self.set_tuner_value(value)
+            return
+
+        try:
             instance   = self.mapper.get_instance(instance_id)
             pluginData = self.plugins[instance_id]
+        except:
+            return
 
-            if portsymbol == ":bypass":
-                pluginData['bypassCC'] = (channel, controller)
-                pluginData['bypassed'] = bool(value)
-            else:
-                pluginData['midiCCs'][portsymbol] = (channel, controller, minimum, maximum)
-                pluginData['ports'][portsymbol] = value
+        pluginData['outputs'][portsymbol] = value
+        # sent to clients all at once on data_finish
+        self.pending_outputs[(instance, portsymbol)] = value
 
-            self.pedalboard_modified = True
-            pluginData['addressings'][portsymbol] = self.addressings.add_midi(instance_id,
-                                                                              portsymbol,
-                                                                              channel, controller,
-                                                                              minimum, maximum)
-
-            self.msg_callback("midi_map %s %s %i %i %f %f" % (instance, portsymbol,
-                                                              channel, controller,
-                                                              minimum, maximum))
-            self.msg_callback("param_set %s %s %f" % (instance, portsymbol, value))
+    def flush_pending_outputs(self):
+        if len(self.pending_outputs) == 0:
+            return
 
-        elif cmd == "midi_program_change":
-            msg_data = data.split(" ", 2)
-            program  = int(msg_data[0])
-            channel  = int(msg_data[1])+1
+        if len(self.pending_outputs) == 1:
+            (instance, portsymbol), value = self.pending_outputs.popitem()
+            self.msg_callback("output_set %s %s %f" % (instance, portsymbol, value))
+            return
 
-            if channel == self.profile.get_midi_prgch_channel("pedalboard"):
-                bank_id = self.bank_id
-                if bank_id >= self.userbanks_offset and bank_id - self.userbanks_offset <= len(self.userbanks):
-                    pedalboards = self.userbanks[bank_id - self.userbanks_offset]['pedalboards']
-                else:
-                    pedalboards = self.alluserpedalboards
+        msg = " ".join("%s %s %f" % (instance, portsymbol, value)
+                       for (instance, portsymbol), value in self.pending_outputs.items())
+        self.pending_outputs.clear()
+        self.msg_callback("output_set_multi " + msg)
 
-                if program >= 0 and program < len(pedalboards):
-                    while self.next_hmi_pedalboard_loading:
-                        yield gen.sleep(0.25)
-                    try:
-                        yield gen.Task(self.hmi_load_bank_pedalboard, bank_id, program, from_hmi=False)
-                    except Exception as e:
-                        logging.exception(e)
+    def process_read_patch_set(self, data):
+        msg_data     = data.split(" ",3)
+        instance_id  = int(msg_data[0])
+        parameteruri = msg_data[1]
+        valuetype    = msg_data[2]
+        valuedata    = msg_data[3]
+
+        try:
+            instance   = self.mapper.get_instance(instance_id)
+            pluginData = self.plugins[instance_id]
+        except:
+            return
+
+        parameter = pluginData['parameters'].get(parameteruri, None)
+        if parameter is not None:
+            if valuetype == 'p' and not valuedata.startswith(USER_FILES_DIR) and os.path.islink(valuedata):
+                valuedata = os.path.realpath(valuedata)
+            parameter[0] = valuedata
+            writable = 1
+        else:
+            writable = 0
+        self.msg_callback("patch_set %s %d %s %s %s" % (instance, writable, parameteruri, valuetype, valuedata))
+
+    def process_read_midi_mapped(self, data):
+        msg_data    = data.split(" ",7)
+        instance_id = int(msg_data[0])
+        portsymbol  = msg_data[1]
+        channel     = int(msg_data[2])
+        controller  = int(msg_data[3])
+        value       = float(msg_data[4])
+        minimum     = float(msg_data[5])
+        maximum     = float(msg_data[6])
+
+        instance   = self.mapper.get_instance(instance_id)
+        pluginData = self.plugins[instance_id]
+
+        if portsymbol == ":bypass":
+            pluginData['bypassCC'] = (channel, controller)
+            pluginData['bypassed'] = bool(value)
+        else:
+            pluginData['midiCCs'][portsymbol] = (channel, controller, minimum, maximum)
+            pluginData['ports'][portsymbol] = value
+
+        self.pedalboard_modified = True
+        pluginData['addressings'][portsymbol] = self.addressings.add_midi(instance_id,
+                                                                          portsymbol,
+                                                                          channel, controller,
+                                                                          minimum, maximum)
+
+        self.msg_callback("midi_map %s %s %i %i %f %f" % (instance, portsymbol,
+                                                          channel, controller,
+                                                          minimum, maximum))
+        self.msg_callback("param_set %s %s %f" % (instance, portsymbol, value))
 
-            elif channel == self.profile.get_midi_prgch_channel("snapshot"):
-                abort_catcher = self.abort_previous_loading_progress("midi_program_change")
+    @gen.coroutine
+    def process_read_midi_program_change(self, data):
+        msg_data = data.split(" ", 2)
+        program  = int(msg_data[0])
+        channel  = int(msg_data[1])+1
+
+        if channel == self.profile.get_midi_prgch_channel("pedalboard"):
+            bank_id = self.bank_id
+            if bank_id >= self.userbanks_offset and bank_id - self.userbanks_offset <= len(self.userbanks):
+                pedalboards = self.userbanks[bank_id - self.userbanks_offset]['pedalboards']
+            else:
+                pedalboards = self.alluserpedalboards
+
+            if program >= 0 and program < len(pedalboards):
+                while self.next_hmi_pedalboard_loading:
+                    yield gen.sleep(0.25)
                 try:
-                    yield gen.Task(self.snapshot_load_gen_helper, program, False, abort_catcher)
+                    yield gen.Task(self.hmi_load_bank_pedalboard, bank_id, program, from_hmi=False)
                 except Exception as e:
                     logging.exception(e)
-                else:
-                    if self.descriptor.get('hmi_set_ss_name', False) and self.current_pedalboard_snapshot_id == program:
-                        name = self.snapshot_name() or DEFAULT_SNAPSHOT_NAME
-                        try:
-                            yield gen.Task(self.hmi.set_snapshot_name, program, name)
-                        except Exception as e:
-                            logging.exception(e)
 
-        elif cmd == "transport":
-            msg_data = data.split(" ",3)
-            rolling  = bool(int(msg_data[0]))
-            bpb      = float(msg_data[1])
-            bpm      = float(msg_data[2])
-            speed    = 1.0 if rolling else 0.0
+        elif channel == self.profile.get_midi_prgch_channel("snapshot"):
+            abort_catcher = self.abort_previous_loading_progress("midi_program_change")
+            try:
+                yield gen.Task(self.snapshot_load_gen_helper, program, False, abort_catcher)
+            except Exception as e:
+                logging.exception(e)
+            else:
+                if self.descriptor.get('hmi_set_ss_name', False) and self.current_pedalboard_snapshot_id == program:
+                    name = self.snapshot_name() or DEFAULT_SNAPSHOT_NAME
+                    try:
+                        yield gen.Task(self.hmi.set_snapshot_name, program, name)
+                    except Exception as e:
+                        logging.exception(e)
 
-            rolling_changed = self.transport_rolling != rolling
-            bpb_changed     = self.transport_bpb != bpb
-            bpm_changed     = self.transport_bpm != bpm
+    @gen.coroutine
+    def process_read_transport(self, data):
+        msg_data = data.split(" ",3)
+        rolling  = bool(int(msg_data[0]))
+        bpb      = float(msg_data[1])
+        bpm      = float(msg_data[2])
+        speed    = 1.0 if rolling else 0.0
 
-            for pluginData in self.plugins.values():
-                _, _2, bpb_symbol, bpm_symbol, speed_symbol = pluginData['designations']
+        rolling_changed = self.transport_rolling != rolling
+        bpb_changed     = self.transport_bpb != bpb
+        bpm_changed     = self.transport_bpm != bpm
 
-                if bpb_symbol is not None and bpb_changed:
-                    pluginData['ports'][bpb_symbol] = bpb
-                    self.msg_callback("param_set %s %s %f" % (pluginData['instance'], bpb_symbol, bpb))
+        for pluginData in self.plugins.values():
+            _, _2, bpb_symbol, bpm_symbol, speed_symbol = pluginData['designations']
 
-                if bpm_symbol is not None and bpm_changed:
-                    pluginData['ports'][bpm_symbol] = bpm
-                    self.msg_callback("param_set %s %s %f" % (pluginData['instance'], bpm_symbol, bpm))
+            if bpb_symbol is not None and bpb_changed:
+                pluginData['ports'][bpb_symbol] = bpb
+                self.msg_callback("param_set %s %s %f" % (pluginData['instance'], bpb_symbol, bpb))
 
-                if speed_symbol is not None and rolling_changed:
-                    pluginData['ports'][speed_symbol] = speed
-                    self.msg_callback("param_set %s %s %f" % (pluginData['instance'], speed_symbol, speed))
+            if bpm_symbol is not None and bpm_changed:
+                pluginData['ports'][bpm_symbol] = bpm
+                self.msg_callback("param_set %s %s %f" % (pluginData['instance'], bpm_symbol, bpm))
 
-            self.transport_rolling = rolling
-            self.transport_bpb     = bpb
-            self.transport_bpm     = bpm
-
-            self.msg_callback("transport %i %f %f %s" % (rolling, bpb, bpm, self.transport_sync))
-
-            if self.hmi.initialized:
-                if rolling_changed:
-                    self.next_hmi_play[0] = rolling
-                    self.next_hmi_play[1] = self.next_hmi_play[2] = True
-
-                if bpb_changed:
-                    self.next_hmi_bpb[0] = bpb
-                    self.next_hmi_bpb[1] = self.next_hmi_bpb[2] = True
-
-                if bpm_changed:
-                    self.next_hmi_bpm[0] = bpm
-                    self.next_hmi_bpm[1] = self.next_hmi_bpm[2] = True
-
-                    for actuator_uri in self.addressings.virtual_addressings:
-                        addrs = self.addressings.virtual_addressings[actuator_uri]
-                        for addr in addrs:
-                            try:
-                                yield gen.Task(self.set_param_from_bpm, addr, bpm)
-                            except Exception as e:
-                                logging.exception(e)
-
-        elif cmd == "log":
-            ltype, lmsg = data.split(" ", 1)
-            self.msg_callback("log " + data)
-
-            if ltype == PLUGIN_LOG_TRACE:
-                logging.debug("[plugin] %s", lmsg)
-            elif ltype == PLUGIN_LOG_NOTE:
-                logging.info("[plugin] %s", lmsg)
-            elif ltype == PLUGIN_LOG_WARNING:
-                logging.warning("[plugin] %s", lmsg)
-            elif ltype == PLUGIN_LOG_ERROR:
-                logging.error("[plugin] %s", lmsg)
+            if speed_symbol is not None and rolling_changed:
+                pluginData['ports'][speed_symbol] = speed
+                self.msg_callback("param_set %s %s %f" % (pluginData['instance'], speed_symbol, speed))
 
-        else:
-            logging.error("[host] unrecognized command: %s", cmd)
+        self.transport_rolling = rolling
+        self.transport_bpb     = bpb
+        self.transport_bpm     = bpm
+
+        self.msg_callback("transport %i %f %f %s" % (rolling, bpb, bpm, self.transport_sync))
+
+        if self.hmi.initialized:
+            if rolling_changed:
+                self.next_hmi_play[0] = rolling
+                self.next_hmi_play[1] = self.next_hmi_play[2] = True
+
+            if bpb_changed:
+                self.next_hmi_bpb[0] = bpb
+                self.next_hmi_bpb[1] = self.next_hmi_bpb[2] = True
+
+            if bpm_changed:
+                self.next_hmi_bpm[0] = bpm
+                self.next_hmi_bpm[1] = self.next_hmi_bpm[2] = True
+
+                for actuator_uri in self.addressings.virtual_addressings:
+                    addrs = self.addressings.virtual_addressings[actuator_uri]
+                    for addr in addrs:
+                        try:
+                            yield gen.Task(self.set_param_from_bpm, addr, bpm)
+                        except Exception as e:
+                            logging.exception(e)
+
+    def process_read_log(self, data):
+        ltype, lmsg = data.split(" ", 1)
+        self.msg_callback("log " + data)
+
+        if ltype == PLUGIN_LOG_TRACE:
+            logging.debug("[plugin] %s", lmsg)
+        elif ltype == PLUGIN_LOG_NOTE:
+            logging.info("[plugin] %s", lmsg)
+        elif ltype == PLUGIN_LOG_WARNING:
+            logging.warning("[plugin] %s", lmsg)
+        elif ltype == PLUGIN_LOG_ERROR:
+            logging.error("[plugin] %s", lmsg)
 
     def process_read_message_pedal_changed(self, portsymbol, value):
         if portsymbol == ":bpb":
@@ -1898,7 +2205,7 @@ class Host(object):
     def process_read_queue(self):
         if self.readsock is None:
             return
-        self.readsock.read_until(b"\0", self.process_read_message)
+        self.readsock.read_bytes(65536, self.process_read_data, partial=True)
 
     def send_output_data_ready(self, now, callback):
         ioloop = IOLoop.instance()
@@ -1910,77 +2217,260 @@ class Host(object):
 
         self.send_notmodified("output_data_ready", callback)
 
+    # A web client is ready to receive more output values.
+    # The next request to mod-host waits for the slowest active client, and is delayed so that
+    # output values are not sent faster than that client can take them.
+    def web_data_ready(self, counter, ws):
+        if counter != self.web_data_ready_counter:
+            return
+
+        self.web_data_ready_replies.add(ws)
+
+        if self.web_data_ready_ok or not self.web_data_ready_clients.issubset(self.web_data_ready_replies):
+            return
+
+        now = IOLoop.instance().time()
+        self.web_data_ready_latency += (now - self.web_data_ready_time - self.web_data_ready_latency) * 0.2
+        self.web_data_ready_continue(now)
+
+    # Some client did not reply in time, continue without it
+    def web_data_ready_expired(self):
+        self.web_data_ready_timeout = None
+
+        if self.web_data_ready_ok:
+            return
+
+        self.web_data_ready_latency += (OUTPUT_DATA_READY_MAX_INTERVAL - self.web_data_ready_latency) * 0.2
+        self.web_data_ready_continue(IOLoop.instance().time())
+
+    def web_data_ready_continue(self, now):
+        ioloop = IOLoop.instance()
+
+        if self.web_data_ready_timeout is not None:
+            ioloop.remove_timeout(self.web_data_ready_timeout)
+            self.web_data_ready_timeout = None
+
+        self.web_data_ready_ok = True
+
+        interval = min(max(self.web_data_ready_latency, OUTPUT_DATA_READY_MIN_INTERVAL), OUTPUT_DATA_READY_MAX_INTERVAL)
+        delay = self.last_data_finish_msg + interval - now
+
+        if delay <= 0.0:
+            self.send_output_data_ready(now, None)
+        elif self.last_data_finish_handle is None:
+            self.last_data_finish_handle = ioloop.call_later(delay, self.send_output_data_ready_later)
+
     @gen.coroutine
     def send_output_data_ready_later(self):
         yield gen.Task(self.send_output_data_ready, None)
 
     def process_write_queue(self):
-        try:
-            msg, callback, datatype = self._queue.pop(0)
+        if self.writesock is None:
+            self._queue.clear()
+            self._batch = None
+            self._idle = True
+            self.process_postponed_messages()
+            return
+
+        # keep up to `pipeline_window` messages in flight, mod-host replies to them in order
+        msgs = []
+        now  = time.monotonic()
+        while len(self._inflight) < self.pipeline_window:
+            # messages of a batch are sent as the window allows, before anything else in the queue
+            if self._batch is not None:
+                batch, index, withlog, waited = self._batch
+                bmsg = batch.msgs[index]
+
+                if withlog:
+                    logging.debug("[host] sending -> %s", bmsg)
+
+                if index + 1 == len(batch):
+                    self._batch = None
+                else:
+                    self._batch[1] = index + 1
+
+                self._inflight.append((bmsg, batch.process_response, batch.datatypes[index], withlog, now, waited))
+                msgs.append("%s\0" % bmsg)
+                continue
+
+            try:
+                msg, callback, datatype, queued = self._queue.popleft()
+            except IndexError:
+                break
+
+            waited = now - queued
+
+            if isinstance(msg, HostCommandBatch):
+                if LOG:
+                    logging.debug("[host] popped bulk from queue: %d messages", len(msg))
+
+                # all messages of a batch are queued together, so it counts as a single sample
+                HOST_QUEUE_SECONDS.observe(waited, ("batch",))
+
+                self._batch = [msg, 0, LOG >= 2, waited]
+                continue
+
             withlog = LOG >= 2 or (LOG and msg not in ("output_data_ready",))
             if withlog:
                 logging.debug("[host] popped from queue: %s", msg)
-        except IndexError:
+                logging.debug("[host] sending -> %s", msg)
+
+            HOST_QUEUE_SECONDS.observe(waited, (msg.split(" ",1)[0],))
+
+            self._inflight.append((msg, callback, datatype, withlog, now, waited))
+            msgs.append("%s\0" % str(msg))
+
+        if len(msgs) != 0:
+            self._idle = False
+            self.writesock.write("".join(msgs).encode("utf-8"))
+
+            if not self._reading:
+                self._reading = True
+                self.writesock.read_until(b"\0", self.process_write_response)
+
+        elif len(self._inflight) == 0:
             self._idle = True
             self.process_postponed_messages()
+
+    def process_write_response(self, resp):
+        self._reading = False
+
+        try:
+            msg, callback, datatype, withlog, sent, waited = self._inflight[0]
+        except IndexError:
+            logging.error("[host] received response without a matching message: %s", repr(resp))
             return
 
+        # mod-host handles messages in order, so the time spent on this one starts when the previous one was answered
+        now = time.monotonic()
+        elapsed = now - max(sent, self._last_response_time)
+        self._last_response_time = now
+
+        self._inflight.popleft()
+        self.command_answered(msg, elapsed, waited)
+        if callback is not None:
+            callback(self.parse_write_response(resp, msg, datatype, withlog))
+
         if self.writesock is None:
-            self.process_write_queue()
             return
 
-        def check_response(resp):
-            if callback is not None:
-                resp = resp.decode("utf-8", errors="ignore")
-                if withlog:
-                    logging.debug("[host] received as response <- %s", repr(resp))
+        if len(self._inflight) != 0 and not self._reading:
+            self._reading = True
+            self.writesock.read_until(b"\0", self.process_write_response)
 
-                if datatype == 'string':
-                    r = resp
-                elif not resp.startswith("resp"):
-                    logging.error("[host] protocol error: %s (for msg: '%s')", ProtocolError(resp), msg)
-                    r = None
-                else:
-                    r = resp.replace("resp ", "").replace("\0", "").strip()
+        self.process_write_queue()
 
-                callback(process_resp(r, datatype))
+    # elapsed is the time mod-host took to answer, waited is the time the command spent in our queue before that
+    def command_answered(self, msg, elapsed, waited):
+        HOST_COMMAND_SECONDS.observe(elapsed, (msg.split(" ",1)[0],))
 
-            self.process_write_queue()
+        if HOST_SLOW_COMMAND_THRESHOLD <= 0.0 or elapsed < HOST_SLOW_COMMAND_THRESHOLD:
+            return
 
-        self._idle = False
+        logging.info("[host] slow command, took %.3fs after waiting %.3fs in queue: %s", elapsed, waited, msg[:200])
+
+        self.slow_commands.append({
+            'time': time.time(),
+            'msg': msg[:200],
+            'elapsed': elapsed,
+            'waited': waited,
+        })
+
+    def parse_write_response(self, resp, msg, datatype, withlog):
+        resp = resp.decode("utf-8", errors="ignore")
         if withlog:
-            logging.debug("[host] sending -> %s", msg)
+            logging.debug("[host] received as response <- %s", repr(resp))
+
+        if datatype == 'string':
+            r = resp
+        elif not resp.startswith("resp"):
+            logging.error("[host] protocol error: %s (for msg: '%s')", ProtocolError(resp), msg)
+            r = None
+        else:
+            r = resp.replace("resp ", "").replace("\0", "").strip()
 
-        encmsg = "%s\0" % str(msg)
-        self.writesock.write(encmsg.encode("utf-8"))
-        self.writesock.read_until(b"\0", check_response)
+        return process_resp(r, datatype)
+
+    def get_queue_stats(self):
+        return {
+            'queued': len(self._queue),
+            'inflight': len(self._inflight),
+            'coalesced': self._queue.coalesced,
+            'data_ready_latency': self.web_data_ready_latency,
+            'slow_commands': list(self.slow_commands),
+        }
 
     # send data to host, set modified flag to true
-    def send_modified(self, msg, callback=None, datatype='int'):
+    def send_modified(self, msg, callback=None, datatype='int', coalesce=None):
         self.pedalboard_modified = True
 
+        # coalesced messages (param_set, patch_set) update the web state through their web message
+        if coalesce is None:
+            self.invalidate_web_state()
+
         if self.crashed:
             if callback is not None:
                 callback(process_resp(None, datatype))
             return
 
-        self._queue.append((msg, callback, datatype))
-        if self._idle:
-            self.process_write_queue()
+        if self._bulk is not None:
+            self._bulk.add(msg, callback, datatype)
+            return
+
+        self._queue.put(msg, callback, datatype, coalesce)
+        self.process_write_queue_if_ready()
 
     # send data to host, don't change modified flag
-    def send_notmodified(self, msg, callback=None, datatype='int'):
+    def send_notmodified(self, msg, callback=None, datatype='int', coalesce=None):
         if self.crashed:
             if callback is not None:
                 callback(process_resp(None, datatype))
             return
 
-        self._queue.append((msg, callback, datatype))
+        if self._bulk is not None:
+            self._bulk.add(msg, callback, datatype)
+            return
+
+        self._queue.put(msg, callback, datatype, coalesce)
 
         if LOG >= 2:
             logging.debug("[host] idle? -> %i", self._idle)
 
-        if self._idle:
+        self.process_write_queue_if_ready()
+
+    # collect all messages sent inside a `with` block and send them to host together, as the in-flight window allows
+    # callback receives the list of all responses, in the same order as the messages were sent
+    @contextmanager
+    def bulk_commands(self, callback=None):
+        parent = self._bulk
+        batch = self._bulk = HostCommandBatch(callback)
+
+        try:
+            yield batch
+        finally:
+            self._bulk = parent
+
+            if parent is not None:
+                parent.merge(batch)
+            else:
+                self.send_batch(batch)
+
+    def send_batch(self, batch):
+        if len(batch) == 0:
+            if batch.callback is not None:
+                batch.callback([])
+            return
+
+        if self.crashed:
+            batch.abort()
+            return
+
+        self._queue.put(batch, None, None)
+        self.process_write_queue_if_ready()
+
+    # new messages go out right away if there is room for them in the in-flight window
+    def process_write_queue_if_ready(self):
+        if self._idle or (self.connected and len(self._inflight) < self.pipeline_window):
             self.process_write_queue()
 
     # -----------------------------------------------------------------------------------------------------------------
@@ -2038,21 +2528,168 @@ class Host(object):
         self.crashed = False
 
         if crashed:
-            self.init_jack()
-            # Setup a few things as done in `init_host`, but without waiting
-            midi_pb_prgch, midi_ss_prgch = self.profile.get_midi_prgch_channels()
-            if midi_pb_prgch >= 1 and midi_pb_prgch <= 16:
-                self.send_notmodified("monitor_midi_program %d 1" % (midi_pb_prgch-1))
-            if midi_ss_prgch >= 1 and midi_ss_prgch <= 16:
-                self.send_notmodified("monitor_midi_program %d 1" % (midi_ss_prgch-1))
-            self.send_notmodified("state_tmpdir {}".format(PEDALBOARD_TMP_DIR))
-            self.send_notmodified("transport %i %f %f" % (self.transport_rolling, self.transport_bpb, self.transport_bpm))
-            self.addressings.cchain.restart_if_crashed()
-
-            if self.transport_sync == "link":
-                self.set_link_enabled()
-            elif self.transport_sync == "midi_clock_slave":
-                self.set_midi_clock_slave_enabled()
+            self.restore_state_after_crash()
+
+        websocket.write_message(self.get_web_state_payload())
+
+        # TODO: restore HMI and CC addressings if crashed
+
+        websocket.write_message("loading_end %d" % self.current_pedalboard_snapshot_id)
+
+    # send everything we know about the current pedalboard back to mod-host
+    def restore_state_after_crash(self):
+        self.init_jack()
+        # Setup a few things as done in `init_host`, but without waiting
+        midi_pb_prgch, midi_ss_prgch = self.profile.get_midi_prgch_channels()
+        if midi_pb_prgch >= 1 and midi_pb_prgch <= 16:
+            self.send_notmodified("monitor_midi_program %d 1" % (midi_pb_prgch-1))
+        if midi_ss_prgch >= 1 and midi_ss_prgch <= 16:
+            self.send_notmodified("monitor_midi_program %d 1" % (midi_ss_prgch-1))
+        self.send_notmodified("state_tmpdir {}".format(PEDALBOARD_TMP_DIR))
+        self.send_notmodified("transport %i %f %f" % (self.transport_rolling, self.transport_bpb, self.transport_bpm))
+        self.addressings.cchain.restart_if_crashed()
+
+        if self.transport_sync == "link":
+            self.set_link_enabled()
+        elif self.transport_sync == "midi_clock_slave":
+            self.set_midi_clock_slave_enabled()
+
+        # jack ports might have changed
+        self.invalidate_web_state()
+
+        with self.bulk_commands():
+            # load plugins first
+            for instance_id, pluginData in self.plugins.items():
+                if instance_id == PEDALBOARD_INSTANCE_ID:
+                    continue
+                self.send_notmodified("add %s %d" % (pluginData['uri'], instance_id))
+
+            # load plugin state if relevant
+            if self.pedalboard_path:
+                self.send_notmodified("state_load \"{}\"".format(self.pedalboard_path))
+
+            # now load plugin parameters and addressings
+            for instance_id, pluginData in self.plugins.items():
+                if instance_id == PEDALBOARD_INSTANCE_ID:
+                    continue
+
+                if pluginData['bypassed']:
+                    self.send_notmodified("bypass %d 1" % (instance_id,))
+                if -1 not in pluginData['bypassCC']:
+                    mchnnl, mctrl = pluginData['bypassCC']
+                    self.send_notmodified("midi_map %d :bypass %i %i 0.0 1.0" % (instance_id, mchnnl, mctrl))
+                if pluginData['preset']:
+                    self.send_notmodified("preset_load %d %s" % (instance_id, pluginData['preset']))
+
+                for symbol, value in pluginData['ports'].items():
+                    self.send_notmodified("param_set %d %s %f" % (instance_id, symbol, value))
+
+                for symbol, value in pluginData['outputs'].items():
+                    if value is None:
+                        continue
+                    self.send_notmodified("monitor_output %d %s" % (instance_id, symbol))
+
+                for paramuri, parameter in pluginData['parameters'].items():
+                    self.send_notmodified("patch_set %d %s \"%s\"" % (instance_id,
+                                                                      paramuri,
+                                                                      str(parameter[0]).replace('"','\\"')))
+
+                for symbol, data in pluginData['midiCCs'].items():
+                    mchnnl, mctrl, minimum, maximum = data
+                    if -1 not in (mchnnl, mctrl):
+                        self.send_notmodified("midi_map %d %s %i %i %f %f" % (instance_id, symbol,
+                                                                              mchnnl, mctrl, minimum, maximum))
+
+                for portsymbol, addressing in pluginData['addressings'].items():
+                    actuator_type = self.addressings.get_actuator_type(addressing['actuator_uri'])
+                    if actuator_type == Addressings.ADDRESSING_TYPE_CV:
+                        source_port_name = self.get_jack_source_port_name(addressing['actuator_uri'])
+                        self.send_notmodified("cv_map %d %s %s %f %f %s" % (instance_id,
+                                                                            portsymbol,
+                                                                            source_port_name,
+                                                                            addressing['minimum'],
+                                                                            addressing['maximum'],
+                                                                            addressing['operational_mode']))
+                    elif actuator_type == Addressings.ADDRESSING_TYPE_HMI and not addressing.get('tempo', False):
+                        hw_id = self.addressings.hmi_uri2hw_map[addressing['actuator_uri']]
+                        self.addressings.remap_host_hmi(hw_id, addressing)
+
+            for port_from, port_to in self.connections:
+                self.send_notmodified("connect %s %s" % (self._fix_host_connection_port(port_from),
+                                                         self._fix_host_connection_port(port_to)))
+
+    # -----------------------------------------------------------------------------------------------------------------
+    # Web state cache
+    # Everything a new web client needs to know about the current pedalboard, as sent by `report_current_state`.
+    # Kept up to date from the messages sent to web clients: values are replaced in-place, anything else rebuilds it.
+
+    WEB_STATE_VALUE_FORMATS = {
+        "param_set": "param_set %s %s %s",
+        "output_set": "output_set %s %s %s",
+        "patch_set": "patch_set %s 1 %s %s",
+    }
+
+    def invalidate_web_state(self):
+        self.web_state = None
+        self.web_state_values = {}
+        self.web_state_payload = None
+
+    # called for every message sent to web clients
+    def update_web_state(self, msg):
+        cmd = msg.split(" ",1)[0]
+
+        if cmd in self.WEB_STATE_IGNORED_MESSAGES:
+            return
+
+        if self.web_state is None:
+            return
+
+        if cmd in ("param_set", "output_set"):
+            data  = msg.split(" ",3)
+            items = (((cmd, data[1], data[2]), data[3]),)
+
+        elif cmd == "output_set_multi":
+            data  = msg.split(" ")
+            items = [(("output_set", data[i], data[i+1]), data[i+2]) for i in range(1, len(data)-2, 3)]
+
+        elif cmd == "patch_set":
+            data = msg.split(" ",4)
+            # read-only parameters are not part of the state
+            if data[2] == "0":
+                return
+            # value type and value
+            items = (((cmd, data[1], data[3]), data[4]),)
+
+        else:
+            self.invalidate_web_state()
+            return
+
+        for key, value in items:
+            if key not in self.web_state_index:
+                self.invalidate_web_state()
+                return
+            self.web_state_values[key] = value
+
+        self.web_state_payload = None
+
+    # all web state messages joined into a single websocket message
+    def get_web_state_payload(self):
+        if self.web_state_payload is None:
+            if self.web_state is None:
+                self.build_web_state()
+
+            lines = list(self.web_state)
+            for key, value in self.web_state_values.items():
+                kind, instance, symbol = key
+                lines[self.web_state_index[key]] = self.WEB_STATE_VALUE_FORMATS[kind] % (instance, symbol, value)
+
+            self.web_state_payload = "\0".join(["batch"] + lines)
+
+        return self.web_state_payload
+
+    def build_web_state(self):
+        lines = []
+        index = {}
 
         midiports = []
         for port_id, port_alias, _ in self.midiports:
@@ -2067,34 +2704,34 @@ class Host(object):
         for i in range(len(self.audioportsIn)):
             name  = self.audioportsIn[i]
             title = name.title().replace(" ","_")
-            websocket.write_message("add_hw_port /graph/%s audio 0 %s %i" % (name, title, i+1))
+            lines.append("add_hw_port /graph/%s audio 0 %s %i" % (name, title, i+1))
 
         # Control Voltage In
         for i in range(len(self.cvportsIn)):
             name  = self.cvportsIn[i]
             title = name.title().replace(" ","_")
-            websocket.write_message("add_hw_port /graph/%s cv 0 %s %i" % (name, title, i+1))
+            lines.append("add_hw_port /graph/%s cv 0 %s %i" % (name, title, i+1))
 
         # Audio Out
         for i in range(len(self.audioportsOut)):
             name  = self.audioportsOut[i]
             title = name.title().replace(" ","_")
-            websocket.write_message("add_hw_port /graph/%s audio 1 %s %i" % (name, title, i+1))
+            lines.append("add_hw_port /graph/%s audio 1 %s %i" % (name, title, i+1))
 
         # Control Voltage Out
         for i in range(len(self.cvportsOut)):
             name  = self.cvportsOut[i]
             title = name.title().replace(" ","_")
-            websocket.write_message("add_hw_port /graph/%s cv 1 %s %i" % (name, title, i+1))
+            lines.append("add_hw_port /graph/%s cv 1 %s %i" % (name, title, i+1))
 
         # MIDI In
         if self.midi_aggregated_mode:
             if has_midi_merger_output_port():
-                websocket.write_message("add_hw_port /graph/midi_merger_out midi 0 All_MIDI_In 1")
+                lines.append("add_hw_port /graph/midi_merger_out midi 0 All_MIDI_In 1")
 
         else:
             if self.hasSerialMidiIn:
-                websocket.write_message("add_hw_port /graph/serial_midi_in midi 0 Serial_MIDI_In 0")
+                lines.append("add_hw_port /graph/serial_midi_in midi 0 Serial_MIDI_In 0")
 
             ports = get_jack_hardware_ports(False, False)
             for i in range(len(ports)):
@@ -2108,16 +2745,16 @@ class Host(object):
                 else:
                     title = name.split(":",1)[-1].title()
                 title = title.replace(" ","_")
-                websocket.write_message("add_hw_port /graph/%s midi 0 %s %i" % (name.split(":",1)[-1], title, i+1))
+                lines.append("add_hw_port /graph/%s midi 0 %s %i" % (name.split(":",1)[-1], title, i+1))
 
         # MIDI Out
         if self.midi_aggregated_mode:
             if has_midi_broadcaster_input_port():
-                websocket.write_message("add_hw_port /graph/midi_broadcaster_in midi 1 All_MIDI_Out 1")
+                lines.append("add_hw_port /graph/midi_broadcaster_in midi 1 All_MIDI_Out 1")
 
         else:
             if self.hasSerialMidiOut:
-                websocket.write_message("add_hw_port /graph/serial_midi_out midi 1 Serial_MIDI_Out 0")
+                lines.append("add_hw_port /graph/serial_midi_out midi 1 Serial_MIDI_Out 0")
 
             ports = get_jack_hardware_ports(False, True)
             for i in range(len(ports)):
@@ -2130,10 +2767,10 @@ class Host(object):
                 else:
                     title = name.split(":",1)[-1].title()
                 title = title.replace(" ","_")
-                websocket.write_message("add_hw_port /graph/%s midi 1 %s %i" % (name.split(":",1)[-1], title, i+1))
+                lines.append("add_hw_port /graph/%s midi 1 %s %i" % (name.split(":",1)[-1], title, i+1))
 
         if self.midi_loopback_enabled:
-            websocket.write_message("add_hw_port /graph/midi_loopback midi 1 MIDI_Loopback 42")
+            lines.append("add_hw_port /graph/midi_loopback midi 1 MIDI_Loopback 42")
 
         rinstances = {
             PEDALBOARD_INSTANCE_ID: PEDALBOARD_INSTANCE
@@ -2146,18 +2783,11 @@ class Host(object):
 
             rinstances[instance_id] = pluginData['instance']
 
-            websocket.write_message("add %s %s %.1f %.1f %d %s %d" % (pluginData['instance'], pluginData['uri'],
-                                                                      pluginData['x'], pluginData['y'],
-                                                                      int(pluginData['bypassed']),
-                                                                      pluginData['sversion'],
-                                                                      int(bool(pluginData['buildEnv']))))
-
-            if crashed:
-                self.send_notmodified("add %s %d" % (pluginData['uri'], instance_id))
-
-        # load plugin state if relevant
-        if crashed and self.pedalboard_path:
-            self.send_notmodified("state_load \"{}\"".format(self.pedalboard_path))
+            lines.append("add %s %s %.1f %.1f %d %s %d" % (pluginData['instance'], pluginData['uri'],
+                                                           pluginData['x'], pluginData['y'],
+                                                           int(pluginData['bypassed']),
+                                                           pluginData['sversion'],
+                                                           int(bool(pluginData['buildEnv']))))
 
         # now load plugin parameters and addressings
         for instance_id, pluginData in self.plugins.items():
@@ -2166,78 +2796,36 @@ class Host(object):
 
             if -1 not in pluginData['bypassCC']:
                 mchnnl, mctrl = pluginData['bypassCC']
-                websocket.write_message("midi_map %s :bypass %i %i 0.0 1.0" % (pluginData['instance'], mchnnl, mctrl))
+                lines.append("midi_map %s :bypass %i %i 0.0 1.0" % (pluginData['instance'], mchnnl, mctrl))
 
             if pluginData['preset']:
-                websocket.write_message("preset %s %s" % (pluginData['instance'], pluginData['preset']))
-
-            if crashed:
-                if pluginData['bypassed']:
-                    self.send_notmodified("bypass %d 1" % (instance_id,))
-                if -1 not in pluginData['bypassCC']:
-                    mchnnl, mctrl = pluginData['bypassCC']
-                    self.send_notmodified("midi_map %d :bypass %i %i 0.0 1.0" % (instance_id, mchnnl, mctrl))
-                if pluginData['preset']:
-                    self.send_notmodified("preset_load %d %s" % (instance_id, pluginData['preset']))
+                lines.append("preset %s %s" % (pluginData['instance'], pluginData['preset']))
 
             for symbol, value in pluginData['ports'].items():
-                websocket.write_message("param_set %s %s %f" % (pluginData['instance'], symbol, value))
-
-                if crashed:
-                    self.send_notmodified("param_set %d %s %f" % (instance_id, symbol, value))
+                index[("param_set", pluginData['instance'], symbol)] = len(lines)
+                lines.append("param_set %s %s %f" % (pluginData['instance'], symbol, value))
 
             for symbol, value in pluginData['outputs'].items():
                 if value is None:
                     continue
-                websocket.write_message("output_set %s %s %f" % (pluginData['instance'], symbol, value))
-
-                if crashed:
-                    self.send_notmodified("monitor_output %d %s" % (instance_id, symbol))
+                index[("output_set", pluginData['instance'], symbol)] = len(lines)
+                lines.append("output_set %s %s %f" % (pluginData['instance'], symbol, value))
 
             for paramuri, parameter in pluginData['parameters'].items():
-                websocket.write_message("patch_set %s 1 %s %c %s" % (pluginData['instance'],
-                                                                     paramuri,
-                                                                     parameter[1],
-                                                                     parameter[0]))
-
-                if crashed:
-                    self.send_notmodified("patch_set %d %s \"%s\"" % (instance_id,
-                                                                      paramuri,
-                                                                      str(parameter[0]).replace('"','\\"')))
-
-            if crashed:
-                for symbol, data in pluginData['midiCCs'].items():
-                    mchnnl, mctrl, minimum, maximum = data
-                    if -1 not in (mchnnl, mctrl):
-                        self.send_notmodified("midi_map %d %s %i %i %f %f" % (instance_id, symbol,
-                                                                              mchnnl, mctrl, minimum, maximum))
-
-                for portsymbol, addressing in pluginData['addressings'].items():
-                    actuator_type = self.addressings.get_actuator_type(addressing['actuator_uri'])
-                    if actuator_type == Addressings.ADDRESSING_TYPE_CV:
-                        source_port_name = self.get_jack_source_port_name(addressing['actuator_uri'])
-                        self.send_notmodified("cv_map %d %s %s %f %f %s" % (instance_id,
-                                                                            portsymbol,
-                                                                            source_port_name,
-                                                                            addressing['minimum'],
-                                                                            addressing['maximum'],
-                                                                            addressing['operational_mode']))
-                    elif actuator_type == Addressings.ADDRESSING_TYPE_HMI and not addressing.get('tempo', False):
-                        hw_id = self.addressings.hmi_uri2hw_map[addressing['actuator_uri']]
-                        self.addressings.remap_host_hmi(hw_id, addressing)
+                index[("patch_set", pluginData['instance'], paramuri)] = len(lines)
+                lines.append("patch_set %s 1 %s %c %s" % (pluginData['instance'],
+                                                          paramuri,
+                                                          parameter[1],
+                                                          parameter[0]))
 
         for port_from, port_to in self.connections:
-            websocket.write_message("connect %s %s" % (port_from, port_to))
-
-            if crashed:
-                self.send_notmodified("connect %s %s" % (self._fix_host_connection_port(port_from),
-                                                         self._fix_host_connection_port(port_to)))
-
-        self.addressings.registerMappings(lambda msg: websocket.write_message(msg), rinstances)
+            lines.append("connect %s %s" % (port_from, port_to))
 
-        # TODO: restore HMI and CC addressings if crashed
+        self.addressings.registerMappings(lines.append, rinstances)
 
-        websocket.write_message("loading_end %d" % self.current_pedalboard_snapshot_id)
+        self.web_state = lines
+        self.web_state_index = index
+        self.web_state_values = {}
 
     # -----------------------------------------------------------------------------------------------------------------
     # Host stuff - add & remove bundles
@@ -2727,7 +3315,8 @@ class Host(object):
             return
 
         pluginData['ports'][symbol] = value
-        self.send_modified("param_set %d %s %f" % (instance_id, symbol, value), callback, datatype='boolean')
+        self.send_modified("param_set %d %s %f" % (instance_id, symbol, value), callback, datatype='boolean',
+                           coalesce=("param_set", instance_id, symbol))
 
     def patch_get(self, instance, paramuri, callback):
         instance_id = self.mapper.get_id_without_creating(instance)
@@ -2743,7 +3332,7 @@ class Host(object):
             parameter[0] = value
 
         self.send_modified("patch_set %d %s \"%s\"" % (instance_id, paramuri, str(value).replace('"','\\"')),
-                           callback, datatype='boolean')
+                           callback, datatype='boolean', coalesce=("patch_set", instance_id, paramuri))
         return parameter is not None
 
     def set_position(self, instance, x, y):
@@ -3457,6 +4046,7 @@ class Host(object):
     # Host stuff - load & save
 
     def load(self, bundlepath, isDefault=False, abort_catcher=None):
+        start = time.monotonic()
         first_pedalboard = self.first_pedalboard
         self.first_pedalboard = False
 
@@ -3665,9 +4255,13 @@ class Host(object):
         else:
             motos = {}
 
-        self.load_pb_plugins(pb['plugins'], instances, rinstances, motos)
-        self.load_pb_connections(pb['connections'], mappedOldMidiIns, mappedOldMidiOuts,
-                                                    mappedNewMidiIns, mappedNewMidiOuts)
+        def loaded(_):
+            PEDALBOARD_LOAD_SECONDS.observe(time.monotonic() - start)
+
+        with self.bulk_commands(loaded):
+            self.load_pb_plugins(pb['plugins'], instances, rinstances, motos)
+            self.load_pb_connections(pb['connections'], mappedOldMidiIns, mappedOldMidiOuts,
+                                                        mappedNewMidiIns, mappedNewMidiOuts)
 
         if bundlepath:
             self.load_pb_snapshots(bundlepath)
@@ -3961,6 +4555,8 @@ class Host(object):
                         port_conns.append((port_from, port_to))
 
     def save(self, title, asNew, callback):
+        start = time.monotonic()
+
         # Save over existing bundlepath
         if self.pedalboard_path and not asNew and \
             os.path.isdir(self.pedalboard_path) and self.pedalboard_path.startswith(LV2_PEDALBOARDS_DIR):
@@ -4010,6 +4606,7 @@ class Host(object):
 
         def state_saved_cb(ok):
             os_sync()
+            PEDALBOARD_SAVE_SECONDS.observe(time.monotonic() - start)
             callback(True, bundlepath, newTitle)
 
         # ask host to save any needed extra state
@@ -4823,6 +5420,7 @@ _:b%i
 
         old_addressing = pluginData['addressings'].pop(portsymbol, None)
         send_hmi_available_pages = False
+        self.invalidate_web_state()
 
         if old_addressing is not None:
             # Need to remove old addressings for that port first
@@ -5016,6 +5614,7 @@ _:b%i
 
         self.pedalboard_modified = True
         pluginData['addressings'][portsymbol] = addressing
+        self.invalidate_web_state()
 
         # Find out if new addressing page should become available
         if self.addressings.addressing_pages and is_hmi_actuator and self.hmi.initialized:
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import logging, time, traceback
+
+from collections import deque
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from mod.settings import LOOP_MONITOR_INTERVAL, LOOP_MONITOR_BLOCK_THRESHOLD
+
+# Keeps track of how late the IOLoop runs a periodic callback (loop lag).
+# With a block threshold set, also records what the loop was running when blocked for longer than that,
+# using tornado's SIGALRM based blocking detection.
+class LoopMonitor(object):
+    def __init__(self, interval, threshold):
+        self.interval  = interval
+        self.threshold = threshold
+        self.timer = None
+        self.last_time = 0.0
+        # most recent lag values, for percentiles
+        self.lags = deque(maxlen=240)
+        # most recent blocking events
+        self.blocks = deque(maxlen=20)
+        # blocking event still in progress
+        self.block = None
+        self.stats = {
+            'samples': 0,
+            'late': 0,
+            'total_lag': 0.0,
+            'max_lag': 0.0,
+            'blocks': 0,
+        }
+
+    # blocking detection needs signals, so it only works in the main thread
+    def start(self, detectBlocking):
+        if self.interval <= 0.0:
+            return
+
+        self.last_time = time.monotonic()
+        self.timer = PeriodicCallback(self.sample, self.interval*1000)
+        self.timer.start()
+
+        if detectBlocking and self.threshold > 0.0:
+            IOLoop.instance().set_blocking_signal_threshold(self.threshold, self.blocked)
+
+    def stop(self):
+        if self.timer is None:
+            return
+
+        self.timer.stop()
+        self.timer = None
+
+        if self.threshold > 0.0:
+            IOLoop.instance().set_blocking_signal_threshold(None, None)
+
+    def sample(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self.last_time - self.interval)
+        self.last_time = now
+
+        self.lags.append(lag)
+        self.stats['samples'] += 1
+        self.stats['total_lag'] += lag
+
+        if lag > self.stats['max_lag']:
+            self.stats['max_lag'] = lag
+
+        # more than 10% of the interval is considered late
+        if lag > self.interval * 0.1:
+            self.stats['late'] += 1
+
+    # called from the SIGALRM handler while the loop is still blocked
+    def blocked(self, signum, frame):
+        if self.block is not None:
+            return
+
+        stack = traceback.extract_stack(frame)
+        self.block = {
+            'time': time.time() - self.threshold,
+            'start': time.monotonic() - self.threshold,
+            'stack': ["%s:%d %s" % (f.filename, f.lineno, f.name) for f in stack],
+        }
+
+        # runs once whatever is blocking the loop returns
+        IOLoop.instance().add_callback_from_signal(self.unblocked)
+
+    def unblocked(self):
+        block = self.block
+        self.block = None
+
+        if block is None:
+            return
+
+        block['duration'] = time.monotonic() - block.pop('start')
+        self.blocks.append(block)
+        self.stats['blocks'] += 1
+
+        logging.warning("[loop] blocked for %.3fs in %s", block['duration'], block['stack'][-1])
+
+    def get_stats(self):
+        stats = self.stats.copy()
+        lags  = sorted(self.lags)
+
+        if len(lags) != 0:
+            stats['lag'] = self.lags[-1]
+            stats['lag_p50'] = lags[len(lags)//2]
+            stats['lag_p99'] = lags[min(len(lags)-1, len(lags)*99//100)]
+            stats['lag_avg'] = stats['total_lag'] / stats['samples']
+
+        stats['interval'] = self.interval
+        stats['threshold'] = self.threshold
+        stats['recent_blocks'] = list(self.blocks)
+        return stats
+
+LOOP_MONITOR = LoopMonitor(LOOP_MONITOR_INTERVAL, LOOP_MONITOR_BLOCK_THRESHOLD)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Minimal metrics in the Prometheus text format, served at /metrics.
+# Metrics are created once at module level with the helpers at the bottom of this file, for example:
+#   COMMANDS = counter("mod_host_commands_total", "Commands sent to mod-host", ("verb",))
+#   COMMANDS.inc(labels=("add",))
+
+from bisect import bisect_left
+
+def _format_labels(names, values, extra=None):
+    labels = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for name, value in zip(names, values)]
+    if extra is not None:
+        labels.append('%s="%s"' % extra)
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class Counter(object):
+    kind = "counter"
+
+    # callback, if set, is called on each collection and returns the value,
+    # or a dict of label values tuple -> value for labeled metrics
+    def __init__(self, name, doc, labels=(), callback=None):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self.callback = callback
+        # label values tuple -> value, metrics without labels start at 0
+        self.values = {} if len(self.labelnames) != 0 else {(): 0}
+
+    def inc(self, amount=1, labels=()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get_values(self):
+        if self.callback is None:
+            return self.values
+        values = self.callback()
+        if isinstance(values, dict):
+            return values
+        return {(): values}
+
+    def render(self, lines):
+        for labels, value in sorted(self.get_values().items()):
+            lines.append("%s%s %s" % (self.name, _format_labels(self.labelnames, labels), _format_value(value)))
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def dec(self, amount=1, labels=()):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+class Histogram(object):
+    kind = "histogram"
+
+    # in seconds
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values tuple -> [bucket counts, sum, count]
+        self.values = {}
+        if len(self.labelnames) == 0:
+            self.values[()] = [[0] * (len(self.buckets)+1), 0.0, 0]
+
+    def observe(self, value, labels=()):
+        try:
+            data = self.values[labels]
+        except KeyError:
+            data = self.values[labels] = [[0] * (len(self.buckets)+1), 0.0, 0]
+
+        data[0][bisect_left(self.buckets, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    def render(self, lines):
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bcount in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bcount
+                lines.append("%s_bucket%s %d" % (self.name,
+                                                 _format_labels(self.labelnames, labels, ("le", _format_value(bound))),
+                                                 cumulative))
+            lines.append("%s_sum%s %s" % (self.name, _format_labels(self.labelnames, labels), _format_value(total)))
+            lines.append("%s_count%s %d" % (self.name, _format_labels(self.labelnames, labels), count))
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.doc))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, doc, labels=(), callback=None):
+    return REGISTRY.register(Counter(name, doc, labels, callback))
+
+def gauge(name, doc, labels=(), callback=None):
+    return REGISTRY.register(Gauge(name, doc, labels, callback))
+
+def histogram(name, doc, labels=(), buckets=Histogram.DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, doc, labels, buckets))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json, os, signal, time
+
+from tornado.ioloop import IOLoop
+
+# Statistical profiler, samples the main thread stack on SIGPROF.
+# SIGPROF only fires while the process is using CPU, so idle time waiting on sockets is not sampled.
+# ITIMER_REAL/SIGALRM is left alone as tornado uses it for blocking detection, see mod/loopmonitor.py
+class SamplingProfiler(object):
+    # safety net, in case nobody stops it
+    MAX_DURATION = 300
+
+    def __init__(self):
+        self.running = False
+        self.interval = 0.0
+        self.start_time = 0.0
+        self.end_time = 0.0
+        self.stop_handle = None
+        # stack tuple of code objects, outermost first -> number of samples
+        self.samples = {}
+
+    def start(self, interval, duration):
+        if self.running:
+            return False
+
+        # raises ValueError when not called from the main thread, nothing has been changed yet
+        signal.signal(signal.SIGPROF, self.sample)
+
+        self.samples = {}
+        self.interval = interval
+        self.running = True
+        self.start_time = self.end_time = time.monotonic()
+
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+        self.stop_handle = IOLoop.instance().call_later(min(duration, self.MAX_DURATION), self.stop)
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+        if self.stop_handle is not None:
+            IOLoop.instance().remove_timeout(self.stop_handle)
+            self.stop_handle = None
+
+        self.running = False
+        self.end_time = time.monotonic()
+        return True
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+
+        stack = tuple(stack)
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def get_status(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'duration': (time.monotonic() if self.running else self.end_time) - self.start_time,
+            'samples': sum(self.samples.values()),
+        }
+
+    def format_code(self, code):
+        return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+    # one line per stack, as used by flamegraph.pl and most flamegraph tools
+    def export_collapsed(self):
+        lines = ["%s %d" % (";".join(self.format_code(code) for code in stack), count)
+                 for stack, count in self.samples.items()]
+        lines.sort()
+        return "\n".join(lines) + "\n"
+
+    # https://www.speedscope.app/ file format
+    def export_speedscope(self):
+        frames = []
+        indexes = {}
+        samples = []
+        weights = []
+
+        for stack, count in self.samples.items():
+            sample = []
+            for code in stack:
+                try:
+                    index = indexes[code]
+                except KeyError:
+                    index = indexes[code] = len(frames)
+                    frames.append({
+                        'name': code.co_name,
+                        'file': code.co_filename,
+                        'line': code.co_firstlineno,
+                    })
+                sample.append(index)
+
+            samples.append(sample)
+            weights.append(count * self.interval)
+
+        return json.dumps({
+            '$schema': "https://www.speedscope.app/file-format-schema.json",
+            'name': "mod-ui",
+            'exporter': "mod-ui",
+            'activeProfileIndex': 0,
+            'shared': {
+                'frames': frames,
+            },
+            'profiles': [{
+                'type': "sampled",
+                'name': "mod-ui",
+                'unit': "seconds",
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        })
+
+PROFILER = SamplingProfiler()
@@ -88,10 +88,39 @@ def process_resp(resp, datatype):
 
     return resp
 
+# Returns a function converting the arguments of a message into argtypes.
+# Commands with 1 or 2 arguments are the ones sent on every encoder tick, so they get a direct path.
+def compile_args_parser(argtypes):
+    argtypes = tuple(argtypes)
+    nargs = len(argtypes)
+
+    def parse_args(msg):
+        return [typ(arg) for typ, arg in zip(argtypes, msg.split(None, nargs)[1:])]
+
+    if nargs == 1:
+        typ1, = argtypes
+
+        def parse_args_1(msg):
+            return [typ1(msg.split(None, 1)[1])]
+
+        return parse_args_1
+
+    if nargs == 2:
+        typ1, typ2 = argtypes
+
+        def parse_args_2(msg):
+            args = msg.split(None, 2)
+            if len(args) != 3:
+                return parse_args(msg)
+            return [typ1(args[1]), typ2(args[2])]
+
+        return parse_args_2
+
+    return parse_args
+
 class Protocol(object):
-    COMMANDS_ARGS = {}
-    COMMANDS_FUNC = {}
-    COMMANDS_USED = []
+    # cmd -> (func, number of args, args parser)
+    COMMANDS = {}
 
     RESPONSES = (
         "r", "resp", "few arguments", "many arguments", "not found",
@@ -103,38 +132,34 @@ class Protocol(object):
             raise ValueError("Model %s is not available" % model)
         if cmd not in CMD_ARGS[model].keys():
             raise ValueError("Command %s is not available" % cmd)
-        if cmd in cls.COMMANDS_USED:
+        if cmd in cls.COMMANDS:
             raise ValueError("Command %s is already registered" % cmd)
 
-        cls.COMMANDS_ARGS[cmd] = CMD_ARGS[model][cmd]
-        cls.COMMANDS_FUNC[cmd] = func
-        cls.COMMANDS_USED.append(cmd)
+        argtypes = CMD_ARGS[model][cmd]
+        cls.COMMANDS[cmd] = (func, len(argtypes), compile_args_parser(argtypes))
 
     def __init__(self, msg):
         self.msg = msg.replace("\0", "").strip()
         self.cmd = ""
         self.args = []
+        self.resp = False
         self.parse()
 
     def is_resp(self):
-        return any(self.msg.startswith(resp) for resp in self.RESPONSES)
+        return self.resp
 
     def run_cmd(self, callback):
-        if not self.cmd:
-            callback("-1003") # TODO: proper error handling
-            return
-
-        cmd = self.COMMANDS_FUNC.get(self.cmd, None)
-        if cmd is None:
+        try:
+            func, nargs, parse_args = self.COMMANDS[self.cmd]
+        except KeyError:
             callback("-1003") # TODO: proper error handling
             return
 
-        if len(self.args) != len(self.COMMANDS_ARGS[self.cmd]):
+        if len(self.args) != nargs:
             callback("-1003") # TODO: proper error handling
             return
 
-        args = self.args + [callback]
-        cmd(*args)
+        func(*self.args, callback)
 
     def process_resp(self, datatype):
         if self.msg.startswith("r "):
@@ -146,27 +171,26 @@ class Protocol(object):
         return self.msg
 
     def parse(self):
-        if not self.msg:
+        msg = self.msg
+
+        if not msg:
             raise ProtocolError("wrong arg type for: '%s'" % (self.cmd,))
-        if self.is_resp():
+        if msg.startswith(self.RESPONSES):
+            self.resp = True
             return
 
-        s = self.msg.find(' ')
-        if s > 0:
-            self.cmd = self.msg[:s]
-            if self.cmd not in self.COMMANDS_USED:
-                raise ProtocolError("not found")
-            args = self.msg.split(None, len(self.COMMANDS_ARGS[self.cmd]))
+        s = msg.find(' ')
+        self.cmd = msg[:s] if s > 0 else msg
+
+        try:
+            parse_args = self.COMMANDS[self.cmd][2]
+        except KeyError:
+            raise ProtocolError("not found")
 
-        else:
-            self.cmd = self.msg
-            if self.cmd not in self.COMMANDS_USED:
-                raise ProtocolError("not found")
-            args = []
+        if s < 0:
+            return
 
         try:
-            self.args = [ typ(arg) for typ, arg in zip(self.COMMANDS_ARGS[self.cmd], args[1:]) ]
-            if not all(str(a) for a in self.args):
-                raise ValueError
+            self.args = parse_args(msg)
         except ValueError:
             raise ProtocolError("wrong arg type for: %s %s" % (self.cmd, self.args))
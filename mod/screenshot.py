@@ -6,10 +6,14 @@ import os
 import subprocess
 import sys
 import logging
+import time
 
 from tornado.ioloop import IOLoop
+from mod.metrics import histogram
 from mod.settings import HTML_DIR, DEV_ENVIRONMENT, DEVICE_KEY, CACHE_DIR, DESKTOP
 
+SCREENSHOT_SECONDS = histogram("mod_screenshot_seconds", "Time taken to generate a pedalboard screenshot", ("result",),
+                               (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0))
 
 def generate_screenshot(bundle_path, callback):
     screenshot = os.path.join(bundle_path, 'screenshot.png')
@@ -78,8 +82,11 @@ class ScreenshotGenerator(object):
             return
 
         self.processing = self.queue.pop(0)
+        start = time.monotonic()
 
         def img_callback(thumbnail=None):
+            SCREENSHOT_SECONDS.observe(time.monotonic() - start, ("ok" if thumbnail else "failed",))
+
             if not thumbnail:
                 for callback in self.callbacks.pop(self.processing, []):
                     callback((False, 0.0))
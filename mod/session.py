@@ -4,6 +4,7 @@
 
 import os, time, logging, json
 
+from collections import deque
 from datetime import timedelta
 from tornado import iostream, gen
 from tornado.ioloop import IOLoop, PeriodicCallback
@@ -11,12 +12,15 @@ from tornado.ioloop import IOLoop, PeriodicCallback
 from mod import safe_json_load, TextFileFlusher
 from mod.development import FakeHost, FakeHMI
 from mod.hmi import HMI
+from mod.metrics import counter, gauge
 from mod.recorder import Recorder, Player
 from mod.screenshot import ScreenshotGenerator
+from mod.webclient import WebBinaryEncoder, WebClient, WEB_FILTERABLE_MESSAGES, WEB_FILTERABLE_BY_INSTANCE
 from mod.settings import (LOG,
                           DEV_ENVIRONMENT, DEV_HMI, DEV_HOST,
                           HMI_SERIAL_PORT, HMI_BAUD_RATE, HMI_TIMEOUT,
-                          PREFERENCES_JSON_FILE, DEFAULT_SNAPSHOT_NAME, UNTITLED_PEDALBOARD_NAME)
+                          PREFERENCES_JSON_FILE, DEFAULT_SNAPSHOT_NAME, UNTITLED_PEDALBOARD_NAME,
+                          WEBSOCKET_RESYNC_EVENTS)
 
 if DEV_HOST:
     Host = FakeHost
@@ -60,6 +64,15 @@ class UserPreferences(object):
             pass
 
 class Session(object):
+    # messages that only make sense at the time they are sent, never replayed to reconnecting clients
+    RESYNC_IGNORED_MESSAGES = ("data_ready", "ping", "stop")
+
+    # messages carrying the latest value of something, receiving them twice after a reconnect is harmless.
+    # clients get the seq of these every RESYNC_SEQ_INTERVAL seconds, any other message carries its own seq.
+    RESYNC_STATE_MESSAGES = ("param_set", "patch_set", "output_set", "output_set_multi", "plugin_pos",
+                             "transport", "stats", "sys_stats")
+    RESYNC_SEQ_INTERVAL = 0.5
+
     def __init__(self):
         logging.basicConfig(level=(logging.DEBUG if LOG else logging.WARNING))
 
@@ -72,6 +85,17 @@ class Session(object):
         self.screenshot_needed = False
         self.screenshot_generator = ScreenshotGenerator()
         self.websockets = []
+        self.webclients = []
+        self.binary_encoder = WebBinaryEncoder()
+        # message type -> clients that filter it, see ws_subscribe
+        self.web_filters = {}
+
+        # recent (seq, msg) sent to websocket clients, so reconnecting clients only get what they missed
+        self.events = deque(maxlen=WEBSOCKET_RESYNC_EVENTS)
+        self.events_epoch = os.urandom(4).hex()
+        self.events_seq = 0
+        self.events_seq_sent = 0
+        self.events_seq_pending = False
 
         # Used in mod-app to know when the current pedalboard changed
         self.pedalboard_changed_callback = lambda ok,bundlepath,title:None
@@ -90,6 +114,27 @@ class Session(object):
             print("Using FakeHMI =>", self.hmi)
 
         self.host = Host(self.hmi, self.prefs, self.msg_callback)
+        self.register_metrics()
+
+    def register_metrics(self):
+        gauge("mod_host_queue_length", "Commands waiting to be sent to mod-host",
+              callback=lambda: self.host.get_queue_stats()['queued'])
+        gauge("mod_host_inflight", "Commands sent to mod-host and waiting for a reply",
+              callback=lambda: self.host.get_queue_stats()['inflight'])
+        counter("mod_host_coalesced_total", "Commands to mod-host replaced by a newer one before being sent",
+                callback=lambda: self.host.get_queue_stats()['coalesced'])
+        gauge("mod_hmi_queue_length", "Messages waiting to be sent to the HMI",
+              callback=lambda: self.hmi.get_stats()['queued'])
+        gauge("mod_hmi_inflight", "Messages sent to the HMI and waiting for a reply",
+              callback=lambda: self.hmi.get_stats()['inflight'])
+        gauge("mod_websocket_clients", "Connected websocket clients",
+              callback=lambda: len(self.webclients))
+        gauge("mod_websocket_congested_clients", "Websocket clients currently falling behind",
+              callback=lambda: sum(1 for client in self.webclients if client.congested))
+        gauge("mod_websocket_pending_bytes", "Bytes waiting to be written to websocket clients",
+              callback=lambda: sum(client.pending for client in self.webclients))
+        gauge("mod_screenshot_queue_length", "Pedalboard screenshots waiting to be generated",
+              callback=lambda: len(self.screenshot_generator.queue))
 
     def signal_save(self):
         # reuse HMI function
@@ -101,6 +146,8 @@ class Session(object):
     def signal_disconnect(self):
         sockets = self.websockets
         self.websockets = []
+        self.webclients = []
+        self.web_filters = {}
         for ws in sockets:
             ws.write_message("stop")
             ws.close()
@@ -233,10 +280,27 @@ class Session(object):
 
     # A new webbrowser page has been open
     # We need to cache its socket address and send any msg callbacks to it
-    def websocket_opened(self, ws, callback):
+    # resync is (epoch, seq) of the last message received, if the client is reconnecting
+    def websocket_opened(self, ws, callback, resync=None):
         def ready(_):
+            client = WebClient(ws, self.binary_encoder)
+            if ws.binary:
+                msg = self.binary_encoder.get_ports_message()
+                if msg is not None:
+                    ws.write_message(msg)
             self.websockets.append(ws)
+            self.webclients.append(client)
+
+            if resync is not None:
+                if not self.host.can_resync() or not self.resync_client(client, resync[0], resync[1]):
+                    # client will reload the page and connect again
+                    client.write("resync_failed")
+                self.host.open_connection_if_needed(None)
+                callback(True)
+                return
+
             self.host.open_connection_if_needed(ws)
+            client.write(self.get_events_seq_message())
             callback(True)
 
         # if this is the 1st socket, start ui session
@@ -252,8 +316,12 @@ class Session(object):
         except ValueError:
             pass
 
+        self.webclients = [client for client in self.webclients if client.ws != ws]
+        self.update_web_filters()
+
         # if this is the last socket, end ui session
         if len(self.websockets) == 0:
+            self.binary_encoder.clear()
             self.host.end_session(callback)
         else:
             callback(True)
@@ -312,10 +380,33 @@ class Session(object):
 
     # Receive data ready, with matching counter value
     # This indicates web browser side is ready to receive more events
-    def ws_data_ready(self, counter):
-        if self.host.web_data_ready_counter == counter:
-            self.host.web_data_ready_ok = True
-            self.host.send_output_data_ready(None, None)
+    def ws_data_ready(self, counter, ws):
+        self.host.web_data_ready(counter, ws)
+
+    # Choose which messages a client receives, by message type and optionally by plugin instance
+    # Returns (ok, error)
+    def ws_subscribe(self, subscribe, mtype, instances, ws):
+        if mtype not in WEB_FILTERABLE_MESSAGES:
+            return (False, "unknown message type %s" % mtype)
+        if len(instances) != 0 and mtype not in WEB_FILTERABLE_BY_INSTANCE:
+            return (False, "%s cannot be filtered per instance" % mtype)
+
+        for client in self.webclients:
+            if client.ws == ws:
+                if subscribe:
+                    client.subscribe(mtype, instances)
+                else:
+                    client.unsubscribe(mtype, instances)
+                break
+
+        self.update_web_filters()
+        return (True, "")
+
+    def update_web_filters(self):
+        self.web_filters = {}
+        for client in self.webclients:
+            for mtype in client.filters:
+                self.web_filters.setdefault(mtype, set()).add(client)
 
     # Set a plugin parameter
     # We use ":bypass" symbol for on/off state
@@ -413,13 +504,152 @@ class Session(object):
     # Everything after this line is yet to be documented
 
     def msg_callback(self, msg):
-        for ws in self.websockets:
-            ws.write_message(msg)
+        self.msg_callback_broadcast(msg, None)
 
     def msg_callback_broadcast(self, msg, ws2):
-        for ws in self.websockets:
-            if ws == ws2: continue
-            ws.write_message(msg)
+        self.host.update_web_state(msg)
+
+        cmd = msg.split(" ",1)[0]
+        seq = self.record_event(cmd, msg)
+        wmsg = msg
+
+        if seq is None:
+            pass
+        elif cmd in self.RESYNC_STATE_MESSAGES:
+            if not self.events_seq_pending and len(self.webclients) != 0:
+                self.events_seq_pending = True
+                IOLoop.instance().call_later(self.RESYNC_SEQ_INTERVAL, self.send_events_seq)
+        else:
+            # message and seq in the same frame, so clients never get one without the other
+            wmsg = "batch\0%s\0%s" % (msg, self.get_events_seq_message())
+            self.events_seq_sent = seq
+        # clients that only want part of these messages
+        filtered = self.web_filters.get("output_set" if cmd == "output_set_multi" else cmd)
+
+        encoded = False
+        bmsg = None
+        # websocket frames built for this message, reused for all clients
+        frames = {}
+
+        for client in self.webclients:
+            # encode only once for all binary clients
+            if client.binary and not encoded:
+                encoded = True
+                bmsg = self.binary_encoder.encode(msg)
+
+            if client.ws == ws2:
+                # new port indexes must reach every binary client, including the one that sent the message
+                client.write_announce(bmsg, frames)
+                if wmsg is not msg:
+                    client.write(self.get_events_seq_message())
+                continue
+
+            if filtered is not None and client in filtered:
+                fmsg = client.filter_message(cmd, msg)
+                if fmsg is msg:
+                    client.write(msg, bmsg, frames)
+                    continue
+                # the full message was already encoded, so encoding a part of it has nothing new to announce
+                client.write_announce(bmsg, frames)
+                if fmsg is not None:
+                    client.write_encoded(fmsg)
+                continue
+
+            client.write(wmsg, bmsg, frames)
+
+    def get_webclients_stats(self):
+        return [client.get_stats() for client in self.webclients]
+
+    # returns the seq of the message, or None if it is not recorded
+    def record_event(self, cmd, msg):
+        if cmd in self.RESYNC_IGNORED_MESSAGES:
+            if cmd == "stop":
+                # mod-host is gone, nothing received so far can be resumed from
+                self.reset_events()
+            return None
+
+        self.events_seq += 1
+        self.events.append((self.events_seq, msg))
+        return self.events_seq
+
+    def reset_events(self):
+        self.events.clear()
+        self.events_epoch = os.urandom(4).hex()
+        self.events_seq = 0
+        self.events_seq_sent = 0
+
+    def get_events_seq_message(self):
+        return "seq %s %d" % (self.events_epoch, self.events_seq)
+
+    # let clients know how far they are after state messages, at most once per RESYNC_SEQ_INTERVAL
+    def send_events_seq(self):
+        self.events_seq_pending = False
+
+        if self.events_seq == self.events_seq_sent:
+            return
+
+        self.events_seq_sent = self.events_seq
+        msg = self.get_events_seq_message()
+
+        for client in self.webclients:
+            client.write(msg)
+
+    # Send a reconnecting client everything after `seq` in a single batch message.
+    # Returns False if those messages are no longer available.
+    def resync_client(self, client, epoch, seq):
+        if epoch != self.events_epoch or seq > self.events_seq:
+            return False
+
+        if seq != self.events_seq:
+            if len(self.events) == 0 or self.events[0][0] > seq+1:
+                return False
+
+            msgs = self.get_events_since(seq)
+            logging.debug("[session] resync from %d to %d, %d messages", seq, self.events_seq, len(msgs))
+            client.write("batch\0" + "\0".join(msgs + [self.get_events_seq_message()]))
+            return True
+
+        client.write(self.get_events_seq_message())
+        return True
+
+    # messages after `seq` (the last one the client has), keeping only the last value of each port
+    def get_events_since(self, seq):
+        msgs = []
+        seen = set()
+
+        for eseq, msg in reversed(self.events):
+            if eseq <= seq:
+                break
+
+            cmd, _, data = msg.partition(" ")
+
+            if cmd == "param_set":
+                key = (cmd,) + tuple(data.split(" ",2)[:2])
+                if key in seen:
+                    continue
+                seen.add(key)
+
+            elif cmd == "patch_set":
+                data = data.split(" ",3)
+                key = (cmd, data[0], data[2])
+                if key in seen:
+                    continue
+                seen.add(key)
+
+            elif cmd in ("output_set", "output_set_multi"):
+                data = data.split(" ")
+                for i in reversed(range(0, len(data)-2, 3)):
+                    key = ("output_set", data[i], data[i+1])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    msgs.append("output_set %s %s %s" % (data[i], data[i+1], data[i+2]))
+                continue
+
+            msgs.append(msg)
+
+        msgs.reverse()
+        return msgs
 
     def load_pedalboard(self, bundlepath, isDefault):
         self.screenshot_needed = False
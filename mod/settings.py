@@ -19,6 +19,8 @@ API_KEY = os.environ.pop('MOD_API_KEY', None)
 DEVICE_KEY = os.environ.pop('MOD_DEVICE_KEY', None)
 DEVICE_TAG = os.environ.pop('MOD_DEVICE_TAG', None)
 DEVICE_UID = os.environ.pop('MOD_DEVICE_UID', None)
+# Secret needed to use the /system/profiler endpoints, which are disabled if unset
+PROFILER_KEY = os.environ.pop('MOD_PROFILER_KEY', None)
 IMAGE_VERSION_PATH = os.environ.pop('MOD_IMAGE_VERSION_PATH', '/etc/mod-release/release')
 HARDWARE_DESC_FILE = os.environ.pop('MOD_HARDWARE_DESC_FILE', '/etc/mod-hardware-descriptor.json')
 
@@ -63,6 +65,38 @@ MODEL_TYPE = os.environ.get('MOD_MODEL_TYPE', None)
 DEVICE_WEBSERVER_PORT = int(os.environ.get('MOD_DEVICE_WEBSERVER_PORT', 80))
 DEVICE_HOST_PORT = int(os.environ.get('MOD_DEVICE_HOST_PORT', 5555))
 
+# How many mod-host commands can be waiting for a response at the same time.
+# Use 1 for strict lock-step, as needed by old mod-host builds that only handle 1 message per socket read.
+HOST_PIPELINE_WINDOW = max(1, int(os.environ.get('MOD_HOST_PIPELINE_WINDOW', 8)))
+
+# Bytes queued for a single websocket client before param_set/output_set messages start being merged,
+# normal sending resumes once the client catches up below the low-water mark.
+WEBSOCKET_HIGH_WATER_MARK = int(os.environ.get('MOD_WEBSOCKET_HIGH_WATER_MARK', 256*1024))
+WEBSOCKET_LOW_WATER_MARK = int(os.environ.get('MOD_WEBSOCKET_LOW_WATER_MARK', WEBSOCKET_HIGH_WATER_MARK//4))
+
+# How many recent websocket messages are kept, so a client that reconnects only needs to receive what it missed.
+# Clients that missed more than this get the full state instead.
+WEBSOCKET_RESYNC_EVENTS = int(os.environ.get('MOD_WEBSOCKET_RESYNC_EVENTS', 4096))
+
+# mod-host commands taking longer than this many seconds to be answered are logged, 0 to disable.
+# Loading a pedalboard has plenty of commands taking 0.1s or so, the default only catches the unusual ones.
+HOST_SLOW_COMMAND_THRESHOLD = float(os.environ.get('MOD_HOST_SLOW_COMMAND_THRESHOLD', 0.5))
+
+# Use permessage-deflate on websocket connections, for clients that support it.
+# Only messages of at least WEBSOCKET_COMPRESSION_THRESHOLD bytes are compressed, smaller ones are not worth the CPU time.
+WEBSOCKET_COMPRESSION = bool(int(os.environ.get('MOD_WEBSOCKET_COMPRESSION', False)))
+WEBSOCKET_COMPRESSION_THRESHOLD = int(os.environ.get('MOD_WEBSOCKET_COMPRESSION_THRESHOLD', 1024))
+
+# Bounds in seconds for how often output port values are requested from mod-host while web clients are connected.
+# The actual interval follows how fast clients reply to "data_ready".
+OUTPUT_DATA_READY_MIN_INTERVAL = float(os.environ.get('MOD_OUTPUT_DATA_READY_MIN_INTERVAL', 0.02))
+OUTPUT_DATA_READY_MAX_INTERVAL = float(os.environ.get('MOD_OUTPUT_DATA_READY_MAX_INTERVAL', 0.5))
+
+# How often in seconds to check if the IOLoop is running late, 0 to disable.
+LOOP_MONITOR_INTERVAL = float(os.environ.get('MOD_LOOP_MONITOR_INTERVAL', 0.5))
+# Record the stack of any callback blocking the IOLoop for longer than this many seconds, 0 to disable.
+LOOP_MONITOR_BLOCK_THRESHOLD = float(os.environ.get('MOD_LOOP_MONITOR_BLOCK_THRESHOLD', 0))
+
 HTML_DIR = os.environ.get('MOD_HTML_DIR', join(sys.prefix, 'share/mod/html/'))
 DEFAULT_PEDALBOARD_COPY = os.environ.pop('MOD_DEFAULT_PEDALBOARD', join(sys.prefix, 'share/mod/default.pedalboard'))
 DEFAULT_PEDALBOARD = join(LV2_PEDALBOARDS_DIR, "default.pedalboard")
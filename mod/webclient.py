@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import logging, time
+
+from collections import OrderedDict
+from struct import Struct
+from tornado.escape import utf8
+from tornado.iostream import StreamClosedError
+from tornado.ioloop import IOLoop
+
+from mod.metrics import counter
+from mod.settings import WEBSOCKET_HIGH_WATER_MARK, WEBSOCKET_LOW_WATER_MARK, WEBSOCKET_COMPRESSION_THRESHOLD
+
+# websocket sub-protocol for clients that accept binary frames for param_set/output_set
+WEB_BINARY_SUBPROTOCOL = "mod-binary"
+
+# first byte of a binary frame, followed by a list of (uint16 port index, float32 value), little endian
+WEB_BINARY_PARAM_SET  = 1
+WEB_BINARY_OUTPUT_SET = 2
+
+WEB_BINARY_MAX_PORTS = 0xffff
+
+# message types clients can subscribe to or unsubscribe from, output_set includes output_set_multi
+WEB_FILTERABLE_MESSAGES = ("param_set", "output_set", "patch_set", "log", "stats", "sys_stats")
+
+# message types that can also be filtered per plugin instance
+WEB_FILTERABLE_BY_INSTANCE = ("param_set", "output_set", "patch_set")
+
+WEBSOCKET_MESSAGES = counter("mod_websocket_messages_total", "Messages sent to websocket clients")
+WEBSOCKET_BYTES = counter("mod_websocket_bytes_total", "Bytes sent to websocket clients, including frame headers")
+WEBSOCKET_COMPRESSED_MESSAGES = counter("mod_websocket_compressed_messages_total",
+                                        "Messages compressed before being sent to websocket clients")
+WEBSOCKET_COMPRESSION_INPUT_BYTES = counter("mod_websocket_compression_input_bytes_total",
+                                            "Bytes of websocket messages before compression")
+WEBSOCKET_COMPRESSION_OUTPUT_BYTES = counter("mod_websocket_compression_output_bytes_total",
+                                             "Bytes of websocket messages after compression")
+WEBSOCKET_COMPRESSION_SECONDS = counter("mod_websocket_compression_seconds_total",
+                                        "Time spent compressing websocket messages")
+
+class WebBinaryEncoder(object):
+    header = Struct("<B")
+    item   = Struct("<Hf")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # (instance, symbol) -> index
+        self.ports = {}
+
+    # message to send to a newly connected client, so it knows about all indexes used so far
+    def get_ports_message(self):
+        if len(self.ports) == 0:
+            return None
+        return "bin_ports " + " ".join("%d %s %s" % (index, instance, symbol)
+                                       for (instance, symbol), index in self.ports.items())
+
+    # Convert a text message into a binary frame.
+    # Returns (announce, frame) where announce is a text message with the new port indexes (or None),
+    # or None if the message cannot be sent as binary.
+    def encode(self, msg):
+        if msg.startswith("param_set "):
+            mtype = WEB_BINARY_PARAM_SET
+        elif msg.startswith("output_set ") or msg.startswith("output_set_multi "):
+            mtype = WEB_BINARY_OUTPUT_SET
+        else:
+            return None
+
+        data = msg.split(" ")[1:]
+
+        if len(data) == 0 or len(data) % 3 != 0:
+            return None
+
+        try:
+            values = [float(value) for value in data[2::3]]
+        except ValueError:
+            return None
+
+        keys = list(zip(data[0::3], data[1::3]))
+
+        if len(self.ports) + len(keys) > WEB_BINARY_MAX_PORTS and any(key not in self.ports for key in keys):
+            return None
+
+        new   = []
+        items = []
+
+        for key, value in zip(keys, values):
+            try:
+                index = self.ports[key]
+            except KeyError:
+                index = self.ports[key] = len(self.ports)
+                new.append("%d %s %s" % (index, key[0], key[1]))
+
+            items.append(self.item.pack(index, value))
+
+        announce = ("bin_ports " + " ".join(new)) if len(new) != 0 else None
+        return (announce, self.header.pack(mtype) + b"".join(items))
+
+# The functions below use internals of tornado 4.3 (the version mod-ui is pinned to), keep all such uses here.
+# Newer versions changed them, missing attributes are handled so that only these features are lost.
+
+# bytes given to the stream of a websocket connection and not yet written to the socket
+def get_write_buffer_size(conn):
+    return getattr(conn.stream, "_write_buffer_size", 0)
+
+# permessage-deflate compressor of a websocket connection, None if compression was not negotiated
+def get_compressor(conn):
+    return getattr(conn, "_compressor", None)
+
+# close a websocket connection without the closing handshake, as tornado does on write errors
+def abort_connection(conn):
+    abort = getattr(conn, "_abort", None)
+    if abort is not None:
+        abort()
+    else:
+        conn.stream.close()
+
+# Build a complete (unmasked) websocket frame, uncompressed ones can be written to many clients
+def build_websocket_frame(data, binary, compressed=False):
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+
+    # FIN bit + opcode, RSV1 bit marks permessage-deflate compressed data
+    header = (0x82 if binary else 0x81) | (0x40 if compressed else 0x00)
+    size = len(data)
+
+    if size < 126:
+        return bytes((header, size)) + data
+    if size <= 0xffff:
+        return bytes((header, 126)) + size.to_bytes(2, "big") + data
+    return bytes((header, 127)) + size.to_bytes(8, "big") + data
+
+def new_compression_stats():
+    return {
+        'messages': 0,
+        'bytes_in': 0,
+        'bytes_out': 0,
+        'time': 0.0,
+    }
+
+# Compress a message with the permessage-deflate context of a connection
+def compress_message(conn, message, stats):
+    message = utf8(message)
+
+    start   = time.perf_counter()
+    data    = get_compressor(conn).compress(message)
+    elapsed = time.perf_counter() - start
+
+    stats['time'] += elapsed
+    stats['messages'] += 1
+    stats['bytes_in'] += len(message)
+    stats['bytes_out'] += len(data)
+
+    WEBSOCKET_COMPRESSED_MESSAGES.inc()
+    WEBSOCKET_COMPRESSION_INPUT_BYTES.inc(len(message))
+    WEBSOCKET_COMPRESSION_OUTPUT_BYTES.inc(len(data))
+    WEBSOCKET_COMPRESSION_SECONDS.inc(elapsed)
+    return data
+
+# Write a single message on a connection, for messages not sent through WebClient.
+# With permessage-deflate only big messages are compressed, small ones are sent as regular frames (without the RSV1 bit).
+def write_websocket_message(conn, message, binary, stats):
+    if get_compressor(conn) is not None and len(message) >= WEBSOCKET_COMPRESSION_THRESHOLD:
+        frame = build_websocket_frame(compress_message(conn, message, stats), binary, True)
+    else:
+        frame = build_websocket_frame(message, binary)
+
+    try:
+        future = conn.stream.write(frame)
+    except StreamClosedError:
+        abort_connection(conn)
+        return None
+
+    WEBSOCKET_MESSAGES.inc()
+    WEBSOCKET_BYTES.inc(len(frame))
+    return future
+
+# A connected websocket client, keeps track of how much data is waiting to be sent to it.
+# When the client falls behind, param_set and output_set messages are held back and only their latest value is kept.
+class WebClient(object):
+    # how often to check if a congested client caught up, in seconds
+    CONGESTION_CHECK_INTERVAL = 0.05
+
+    def __init__(self, ws, encoder):
+        self.ws = ws
+        self.binary = ws.binary
+        self.encoder = encoder
+        self.congested = False
+        self.congestion_check = None
+        # bytes given to tornado and not yet written to the socket
+        self.pending = 0
+        # (instance, symbol) -> value, held back while congested
+        self.deferred_params = OrderedDict()
+        self.deferred_outputs = OrderedDict()
+        # message type -> [everything, instances], types not listed are always received.
+        # if everything is true the instances are the ones not wanted, otherwise they are the only ones wanted.
+        self.filters = {}
+        self.stats = {
+            'messages': 0,
+            'bytes': 0,
+            'max_pending': 0,
+            'congested': 0,
+            'deferred': 0,
+            'coalesced': 0,
+        }
+
+    # bmsg is the (announce, frame) tuple from WebBinaryEncoder, used for binary clients
+    # frames is a dict shared between all clients of a broadcast, so each frame is only built once
+    def write(self, msg, bmsg=None, frames=None):
+        if self.binary and bmsg is not None:
+            announce, frame = bmsg
+            # port indexes must always be known by the client, even if the value is held back
+            if announce is not None:
+                self.write_raw(announce, False, frames)
+        else:
+            frame = None
+
+        if self.congested:
+            if self.defer(msg):
+                return
+            # keep ordering with other messages
+            self.flush_deferred()
+
+        if frame is not None:
+            self.write_raw(frame, True, frames)
+        else:
+            self.write_raw(msg, False, frames)
+
+    def write_announce(self, bmsg, frames=None):
+        if self.binary and bmsg is not None and bmsg[0] is not None:
+            self.write_raw(bmsg[0], False, frames)
+
+    def write_raw(self, data, binary, frames=None):
+        conn = self.ws.ws_connection
+
+        # connection closed
+        if conn is None:
+            return
+
+        # messages to be compressed need a frame of their own
+        if get_compressor(conn) is not None and len(data) >= WEBSOCKET_COMPRESSION_THRESHOLD:
+            if self.ws.compression_stats is None:
+                self.ws.compression_stats = new_compression_stats()
+            frame = build_websocket_frame(compress_message(conn, data, self.ws.compression_stats), binary, True)
+
+        elif frames is None:
+            frame = build_websocket_frame(data, binary)
+
+        else:
+            try:
+                frame = frames[(binary, data)]
+            except KeyError:
+                frame = frames[(binary, data)] = build_websocket_frame(data, binary)
+
+        try:
+            conn.stream.write(frame)
+        except StreamClosedError:
+            abort_connection(conn)
+            return
+
+        size = len(frame)
+        self.stats['messages'] += 1
+        self.stats['bytes'] += size
+        WEBSOCKET_MESSAGES.inc()
+        WEBSOCKET_BYTES.inc(size)
+
+        self.update_pending()
+
+        if not self.congested and self.pending > WEBSOCKET_HIGH_WATER_MARK:
+            self.congested = True
+            self.stats['congested'] += 1
+            logging.debug("[webclient] client %s is congested, %d bytes pending", self.ws.request.remote_ip, self.pending)
+            self.congestion_check = IOLoop.current().call_later(self.CONGESTION_CHECK_INTERVAL, self.check_congestion)
+
+    # tornado only resolves the future of the last write, once everything is written,
+    # so the backlog is taken from the stream write buffer instead
+    def update_pending(self):
+        conn = self.ws.ws_connection
+
+        if conn is None or conn.stream.closed():
+            self.pending = 0
+            return
+
+        self.pending = get_write_buffer_size(conn)
+        if self.pending > self.stats['max_pending']:
+            self.stats['max_pending'] = self.pending
+
+    def check_congestion(self):
+        self.congestion_check = None
+        self.update_pending()
+
+        conn = self.ws.ws_connection
+        if conn is None or conn.stream.closed():
+            return
+
+        if self.pending <= WEBSOCKET_LOW_WATER_MARK:
+            self.congested = False
+            self.flush_deferred()
+        else:
+            self.congestion_check = IOLoop.current().call_later(self.CONGESTION_CHECK_INTERVAL, self.check_congestion)
+
+    def defer(self, msg):
+        if msg.startswith("param_set "):
+            deferred = self.deferred_params
+        elif msg.startswith("output_set ") or msg.startswith("output_set_multi "):
+            deferred = self.deferred_outputs
+        else:
+            return False
+
+        data = msg.split(" ")[1:]
+
+        for i in range(0, len(data)-2, 3):
+            key = (data[i], data[i+1])
+            if key in deferred:
+                self.stats['coalesced'] += 1
+            else:
+                self.stats['deferred'] += 1
+            deferred[key] = data[i+2]
+
+        return True
+
+    def flush_deferred(self):
+        params  = self.deferred_params
+        outputs = self.deferred_outputs
+
+        if len(params) == 0 and len(outputs) == 0:
+            return
+
+        self.deferred_params = OrderedDict()
+        self.deferred_outputs = OrderedDict()
+
+        for (instance, symbol), value in params.items():
+            self.write_encoded("param_set %s %s %s" % (instance, symbol, value))
+
+        if len(outputs) == 1:
+            (instance, symbol), value = outputs.popitem()
+            self.write_encoded("output_set %s %s %s" % (instance, symbol, value))
+
+        elif len(outputs) != 0:
+            self.write_encoded("output_set_multi " + " ".join("%s %s %s" % (instance, symbol, value)
+                                                              for (instance, symbol), value in outputs.items()))
+
+    def write_encoded(self, msg):
+        self.write(msg, self.encoder.encode(msg) if self.binary else None)
+
+    def subscribe(self, mtype, instances):
+        # no instances means everything of this type
+        if len(instances) == 0:
+            self.filters.pop(mtype, None)
+            return
+
+        try:
+            everything, filtered = self.filters[mtype]
+        except KeyError:
+            return
+
+        if everything:
+            filtered.difference_update(instances)
+            if len(filtered) == 0:
+                self.filters.pop(mtype)
+        else:
+            filtered.update(instances)
+
+    def unsubscribe(self, mtype, instances):
+        # no instances means nothing of this type
+        if len(instances) == 0:
+            self.filters[mtype] = [False, set()]
+            return
+
+        try:
+            everything, filtered = self.filters[mtype]
+        except KeyError:
+            self.filters[mtype] = [True, set(instances)]
+            return
+
+        if everything:
+            filtered.update(instances)
+        else:
+            filtered.difference_update(instances)
+
+    def wants(self, mtype, instance):
+        try:
+            everything, filtered = self.filters[mtype]
+        except KeyError:
+            return True
+
+        return (instance in filtered) != everything
+
+    # Returns the part of a broadcast message this client is subscribed to, or None if there is nothing to send.
+    # cmd is the first word of msg.
+    def filter_message(self, cmd, msg):
+        if cmd == "output_set_multi":
+            data  = msg.split(" ")[1:]
+            items = [data[i:i+3] for i in range(0, len(data)-2, 3) if self.wants("output_set", data[i])]
+
+            if len(items) == 0:
+                return None
+            if len(items)*3 == len(data):
+                return msg
+            if len(items) == 1:
+                return "output_set " + " ".join(items[0])
+            return "output_set_multi " + " ".join(" ".join(item) for item in items)
+
+        if cmd in WEB_FILTERABLE_BY_INSTANCE:
+            instance = msg.split(" ",2)[1]
+        else:
+            instance = None
+
+        return msg if self.wants(cmd, instance) else None
+
+    def get_stats(self):
+        stats = self.stats.copy()
+        stats['address'] = self.ws.request.remote_ip
+        stats['pending'] = self.pending
+        stats['currently_congested'] = self.congested
+        stats['binary'] = self.binary
+
+        compression = getattr(self.ws, "compression_stats", None)
+        if compression is not None and compression['messages'] != 0:
+            stats['compression'] = dict(compression, ratio=compression['bytes_out']/compression['bytes_in'])
+
+        return stats
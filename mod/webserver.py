@@ -2,8 +2,10 @@
 # SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
+import hmac
 import json
 import logging
+import math
 import os
 import re
 import shutil
@@ -35,6 +37,7 @@ from mod.settings import (DESKTOP, LOG, DEV_API,
                           USER_BANKS_JSON_FILE,
                           LV2_PLUGIN_DIR, LV2_PEDALBOARDS_DIR, IMAGE_VERSION,
                           UPDATE_CC_FIRMWARE_FILE, UPDATE_MOD_OS_FILE, UPDATE_MOD_OS_HERLPER_FILE,
+                          WEBSOCKET_COMPRESSION, PROFILER_KEY,
                           DEFAULT_ICON_TEMPLATE, DEFAULT_SETTINGS_TEMPLATE, DEFAULT_ICON_IMAGE,
                           DEFAULT_PEDALBOARD, DEFAULT_SNAPSHOT_NAME, DATA_DIR, KEYS_PATH, USER_FILES_DIR,
                           FAVORITES_JSON_FILE, PREFERENCES_JSON_FILE, USER_ID_JSON_FILE,
@@ -46,7 +49,11 @@ from mod import (
     get_hardware_descriptor, get_unique_name, os_sync, symbolify,
 )
 from mod.bank import list_banks, save_banks, remove_pedalboard_from_banks
+from mod.loopmonitor import LOOP_MONITOR
+from mod.metrics import REGISTRY
+from mod.profiler import PROFILER
 from mod.session import SESSION
+from mod.webclient import WEB_BINARY_SUBPROTOCOL, new_compression_stats, write_websocket_message
 from modtools.utils import (
     kPedalboardInfoUserOnly, kPedalboardInfoFactoryOnly, kPedalboardInfoBoth,
     init as lv2_init, cleanup as lv2_cleanup,
@@ -401,6 +408,74 @@ class SystemInfo(JsonRequestHandler):
 
         self.write(info)
 
+class Metrics(TimelessRequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(REGISTRY.render())
+
+class SystemHost(JsonRequestHandler):
+    def get(self):
+        self.write(SESSION.host.get_queue_stats())
+
+class SystemHMI(JsonRequestHandler):
+    def get(self):
+        self.write(SESSION.hmi.get_stats())
+
+class SystemWebsockets(JsonRequestHandler):
+    def get(self):
+        self.write(SESSION.get_webclients_stats())
+
+class SystemProfiler(JsonRequestHandler):
+    def prepare(self):
+        key = self.request.headers.get("X-Profiler-Key", None) or self.get_argument("key", "")
+        if not PROFILER_KEY or not hmac.compare_digest(key.encode("utf-8"), PROFILER_KEY.encode("utf-8")):
+            raise web.HTTPError(403)
+
+    def get(self, action):
+        if action == "status":
+            self.write(PROFILER.get_status())
+
+        elif action == "collapsed":
+            self.set_header("Content-Type", "text/plain; charset=UTF-8")
+            self.set_header("Content-Disposition", "attachment; filename=mod-ui.collapsed.txt")
+            self.write(PROFILER.export_collapsed())
+
+        elif action == "speedscope":
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+            self.set_header("Content-Disposition", "attachment; filename=mod-ui.speedscope.json")
+            self.write(PROFILER.export_speedscope())
+
+        else:
+            raise web.HTTPError(404)
+
+    def post(self, action):
+        if action == "start":
+            try:
+                interval = float(self.get_argument("interval", 0.005))
+                duration = float(self.get_argument("duration", PROFILER.MAX_DURATION))
+            except ValueError:
+                raise web.HTTPError(400, "Invalid interval or duration")
+
+            if not (math.isfinite(interval) and interval > 0.0 and math.isfinite(duration) and duration > 0.0):
+                raise web.HTTPError(400, "Invalid interval or duration")
+
+            try:
+                ok = PROFILER.start(max(0.001, interval), duration)
+            except ValueError as e:
+                raise web.HTTPError(500, "Cannot start profiler: %s" % e)
+
+        elif action == "stop":
+            ok = PROFILER.stop()
+
+        else:
+            raise web.HTTPError(404)
+
+        self.write(ok)
+
+class SystemLoop(JsonRequestHandler):
+    def get(self):
+        self.write(LOOP_MONITOR.get_stats())
+
 class SystemPreferences(JsonRequestHandler):
     OPTION_NULL            = 0
     OPTION_FILE_EXISTS     = 1
@@ -1173,11 +1248,40 @@ class RemotePluginWebSocket(websocket.WebSocketHandler):
         self.write_message(json.dumps(resp))
 
 class ServerWebSocket(websocket.WebSocketHandler):
+    # set if the client negotiated the binary sub-protocol
+    binary = False
+    compression_stats = None
+
+    def select_subprotocol(self, subprotocols):
+        if WEB_BINARY_SUBPROTOCOL in subprotocols:
+            self.binary = True
+            return WEB_BINARY_SUBPROTOCOL
+        return None
+
+    def get_compression_options(self):
+        return {} if WEBSOCKET_COMPRESSION else None
+
+    # direct writes, like the initial state sent on connect, go through here and are counted in /metrics
+    def write_message(self, message, binary=False):
+        conn = self.ws_connection
+        if conn is None or isinstance(message, dict):
+            return websocket.WebSocketHandler.write_message(self, message, binary)
+        if self.compression_stats is None:
+            self.compression_stats = new_compression_stats()
+        return write_websocket_message(conn, message, binary, self.compression_stats)
+
     @gen.coroutine
     def open(self):
         print("websocket open")
         self.set_nodelay(True)
-        yield gen.Task(SESSION.websocket_opened, self)
+
+        # set by clients reconnecting after a connection drop
+        try:
+            resync = (self.get_argument("epoch"), int(self.get_argument("seq")))
+        except (web.MissingArgumentError, ValueError):
+            resync = None
+
+        yield gen.Task(SESSION.websocket_opened, self, resync=resync)
 
     @gen.coroutine
     def on_close(self):
@@ -1193,7 +1297,7 @@ class ServerWebSocket(websocket.WebSocketHandler):
 
         if cmd == "data_ready":
             counter = int(data[1])
-            SESSION.ws_data_ready(counter)
+            SESSION.ws_data_ready(counter, self)
             return
 
         elif cmd == "param_set":
@@ -1254,6 +1358,14 @@ class ServerWebSocket(websocket.WebSocketHandler):
             inst = data[1]
             SESSION.ws_show_external_ui(inst)
 
+        elif cmd in ("subscribe", "unsubscribe"):
+            data  = data[1].split() if len(data) == 2 else []
+            mtype = data[0] if len(data) != 0 else None
+
+            ok, error = SESSION.ws_subscribe(cmd == "subscribe", mtype, data[1:], self)
+            if not ok:
+                logging.warning("[websocket] invalid %s request: %s", cmd, error)
+
         else:
             print("Unexpected command received over websocket")
 
@@ -2267,6 +2379,11 @@ application = web.Application(
         [
             (r"/system/info", SystemInfo),
             (r"/system/prefs", SystemPreferences),
+            (r"/system/loop", SystemLoop),
+            (r"/system/host", SystemHost),
+            (r"/system/hmi", SystemHMI),
+            (r"/system/websockets", SystemWebsockets),
+            (r"/system/profiler/(start|stop|status|collapsed|speedscope)", SystemProfiler),
             (r"/system/exechange", SystemExeChange),
             (r"/system/cleanup", SystemCleanup),
 
@@ -2367,6 +2484,7 @@ application = web.Application(
             (r"/config/set", SaveSingleConfigValue),
 
             (r"/ping/?", Ping),
+            (r"/metrics", Metrics),
             (r"/hello/?", Hello),
 
             (r"/truebypass/(Left|Right)/(true|false)", TrueBypass),
@@ -2470,6 +2588,8 @@ def prepare(isModApp = False):
 
     application.listen(DEVICE_WEBSERVER_PORT, address=("127.0.0.1" if DESKTOP else "0.0.0.0"))
 
+    LOOP_MONITOR.start(haveSignal and not isModApp)
+
     def checkhost():
         if SESSION.host.readsock is None or SESSION.host.writesock is None:
 
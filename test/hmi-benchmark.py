@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Load test for the HMI protocol, no HMI hardware, Jack or mod-host needed.
+# mod-ui is started in development mode (fake mod-host) and talks to FakeHMIDevice (see mod/development.py)
+# through a pseudo-terminal, which sends HMI commands and measures how long mod-ui takes to reply.
+#
+# Like the real HMI, only one command is sent at a time, the next one goes after the reply.
+# Commands for actuators or pages that are not addressed are still answered (with an error code),
+# pass a hardware descriptor and use a pedalboard with addressings to exercise the full paths.
+#
+# Examples:
+#   python3 test/hmi-benchmark.py
+#   python3 test/hmi-benchmark.py --latency 0.002 --cmd-latency a=0.01 --split-replies
+#   python3 test/hmi-benchmark.py --drop-rate 0.01 --hmi-timeout 2 --scenario encoder
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from mod.development import FakeHMIDevice
+from mod.mod_protocol import CMD_BANKS, CMD_CONTROL_SET, CMD_NEXT_PAGE, CMD_PEDALBOARDS
+
+SCENARIOS = ("footswitch", "encoder", "bank-navigation", "page-change")
+
+def footswitch_commands(hw_id, presses=50):
+    msgs = []
+    for i in range(presses):
+        msgs.append("%s %d 1" % (CMD_CONTROL_SET, hw_id))
+        msgs.append("%s %d 0" % (CMD_CONTROL_SET, hw_id))
+    return msgs
+
+def encoder_commands(hw_id, steps=200):
+    return ["%s %d %f" % (CMD_CONTROL_SET, hw_id, i / steps) for i in range(steps)]
+
+def bank_navigation_commands(steps=25):
+    msgs = []
+    for i in range(steps):
+        msgs.append("%s %d 0" % (CMD_BANKS, i % 2))
+        msgs.append("%s 0 0 1" % CMD_PEDALBOARDS)
+    return msgs
+
+def page_change_commands(pages=4, steps=50):
+    return ["%s %d" % (CMD_NEXT_PAGE, i % pages) for i in range(steps)]
+
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values)-1, int(len(values) * p / 100))]
+
+@gen.coroutine
+def run_scenario(hmi, args, name):
+    received = hmi.received
+    latencies = []
+    errors = 0
+    start = time.monotonic()
+
+    for i in range(args.rounds):
+        if name == "footswitch":
+            msgs = footswitch_commands(args.footswitch)
+        elif name == "encoder":
+            msgs = encoder_commands(args.knob)
+        elif name == "bank-navigation":
+            msgs = bank_navigation_commands()
+        else:
+            msgs = page_change_commands()
+
+        for msg in msgs:
+            reply, latency = yield hmi.send_command(msg)
+            latencies.append(latency)
+
+            try:
+                if int(reply.split(" ",2)[1]) < 0:
+                    errors += 1
+            except (IndexError, ValueError):
+                errors += 1
+
+    elapsed = time.monotonic() - start
+    latencies.sort()
+
+    print("%-16s %6d cmds %6d errors %6d to hmi %8.1f cmds/s   p50 %7.2fms  p90 %7.2fms  p99 %7.2fms  max %7.2fms" % (
+          name, len(latencies), errors, hmi.received - received, len(latencies) / elapsed,
+          percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000,
+          percentile(latencies, 99) * 1000, latencies[-1] * 1000 if latencies else 0.0))
+
+# mod-ui is ready once it stops talking to the HMI after the initial handshake
+@gen.coroutine
+def wait_for_mod_ui(hmi, proc, args):
+    start = time.monotonic()
+
+    while hmi.received == 0 or time.monotonic() - hmi.last_received < args.settle:
+        if proc.poll() is not None:
+            raise RuntimeError("mod-ui exited with code %d" % proc.returncode)
+        if time.monotonic() - start > args.startup_timeout:
+            raise RuntimeError("mod-ui did not talk to the HMI in %ds" % args.startup_timeout)
+        yield gen.sleep(0.1)
+
+@gen.coroutine
+def main(args):
+    cmd_latency = {}
+    if args.cmd_latency:
+        for item in args.cmd_latency.split(","):
+            cmd, latency = item.split("=", 1)
+            cmd_latency[cmd] = float(latency)
+
+    hmi = FakeHMIDevice(args.latency, cmd_latency, args.drop_rate, args.split_replies)
+    hmi.start()
+
+    datadir = tempfile.mkdtemp(prefix="mod-hmi-benchmark-")
+    env = dict(os.environ,
+               MOD_DEV_ENVIRONMENT="1",
+               MOD_DEV_HMI="0",
+               MOD_HMI_SERIAL_PORT=hmi.path,
+               MOD_HMI_TIMEOUT=str(args.hmi_timeout),
+               MOD_DATA_DIR=datadir,
+               MOD_LOG="1" if args.verbose else "0")
+    if args.hardware_descriptor:
+        env['MOD_HARDWARE_DESC_FILE'] = os.path.abspath(args.hardware_descriptor)
+
+    output = None if args.verbose else subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py")], env=env, stdout=output, stderr=output)
+
+    try:
+        yield wait_for_mod_ui(hmi, proc, args)
+
+        print("hmi latency %.2fms, drop rate %.2f%%, %d messages from mod-ui during startup" % (
+              args.latency * 1000, args.drop_rate * 100, hmi.received))
+
+        scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+        for name in scenarios:
+            yield run_scenario(hmi, args, name)
+
+        print("messages from mod-ui: %s" % ", ".join("%s=%d" % item for item in sorted(hmi.cmds.items())))
+        if hmi.dropped != 0:
+            print("replies dropped: %d" % hmi.dropped)
+
+    finally:
+        proc.terminate()
+        proc.wait()
+        hmi.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HMI to mod-ui communication")
+    parser.add_argument("--scenario", default="all", choices=SCENARIOS + ("all",))
+    parser.add_argument("--rounds", type=int, default=5, help="how many times to run each scenario")
+    parser.add_argument("--latency", type=float, default=0.0005, help="seconds the HMI takes to reply to mod-ui")
+    parser.add_argument("--cmd-latency", default="", help="per command latency, as cmd=seconds,cmd=seconds")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance of the HMI never replying to a message")
+    parser.add_argument("--split-replies", action="store_true", help="write each HMI reply in 2 parts")
+    parser.add_argument("--hmi-timeout", type=int, default=0, help="MOD_HMI_TIMEOUT for mod-ui")
+    parser.add_argument("--hardware-descriptor", default="", help="hardware descriptor json for mod-ui")
+    parser.add_argument("--footswitch", type=int, default=0, help="hw_id used for footswitch presses")
+    parser.add_argument("--knob", type=int, default=1, help="hw_id used for encoder turns")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds without HMI traffic before mod-ui is considered ready")
+    parser.add_argument("--startup-timeout", type=int, default=30)
+    parser.add_argument("--verbose", action="store_true", help="show mod-ui output")
+
+    IOLoop.instance().run_sync(lambda: main(parser.parse_args()))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2012-2023 MOD Audio UG
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# Benchmark for the mod-host protocol code in mod/host.py, no audio hardware needed.
+# mod.host.Host talks to FakeModHost (see mod/development.py), which answers each command after a configurable delay.
+#
+# Built-in scenarios simulate a pedalboard load, snapshot switches and a knob sweep.
+# Sessions recorded with MOD_LOG=1 can be replayed too, all "[host] sending -> " lines are sent as fast as possible.
+#
+# Examples:
+#   python3 test/host-benchmark.py
+#   python3 test/host-benchmark.py --latency 0.0005 --verb-latency add=0.02,preset_load=0.01 --window 1
+#   python3 test/host-benchmark.py --scenario none mod-ui.log
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from mod.development import FakeHMI, FakeModHost, FakePreferences
+from mod.host import Host
+
+SCENARIOS = ("pedalboard-load", "snapshot-switch", "knob-sweep")
+
+def pedalboard_load_commands(plugins=20, params=10):
+    msgs = ["remove -1"]
+    for i in range(plugins):
+        msgs.append("add http://example.org/plugins/bench%d %d" % (i % 5, i))
+        for j in range(params):
+            msgs.append("param_set %d param%d %f" % (i, j, j / params))
+        msgs.append("bypass %d 0" % i)
+    for i in range(plugins-1):
+        msgs.append("connect effect_%d:out effect_%d:in" % (i, i+1))
+    return msgs
+
+def snapshot_switch_commands(plugins=20, params=10, value=0.0):
+    return ["param_set %d param%d %f" % (i, j, value) for i in range(plugins) for j in range(params)]
+
+def knob_sweep_commands(steps=500):
+    return ["param_set 0 gain %f" % (i / steps) for i in range(steps)]
+
+def recorded_commands(filename):
+    sep  = "[host] sending -> "
+    msgs = []
+    with open(filename) as fh:
+        for line in fh:
+            if sep in line:
+                msgs.append(line.strip().split(sep, 1)[1])
+    return msgs
+
+# same coalescing as Host.param_set
+def coalesce_key(msg):
+    if not msg.startswith("param_set "):
+        return None
+    data = msg.split(" ", 3)
+    try:
+        return ("param_set", int(data[1]), data[2])
+    except ValueError:
+        return None
+
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values)-1, int(len(values) * p / 100))]
+
+# Send msgs through host, `spacing` seconds apart (0 means all at once).
+# Resolves to the list of latencies from sending each message to its callback.
+def run_commands(host, msgs, spacing=0.0, bulk=False):
+    future = Future()
+    latencies = []
+
+    if len(msgs) == 0:
+        future.set_result(latencies)
+        return future
+
+    def send(msg):
+        start = time.monotonic()
+
+        def callback(resp):
+            latencies.append(time.monotonic() - start)
+            if len(latencies) == len(msgs):
+                future.set_result(latencies)
+
+        host.send_notmodified(msg, callback, coalesce=coalesce_key(msg))
+
+    if spacing > 0.0:
+        ioloop = IOLoop.instance()
+        for i, msg in enumerate(msgs):
+            ioloop.call_later(i * spacing, send, msg)
+
+    elif bulk:
+        with host.bulk_commands():
+            for msg in msgs:
+                send(msg)
+
+    else:
+        for msg in msgs:
+            send(msg)
+
+    return future
+
+@gen.coroutine
+def run_scenario(host, modhost, name, rounds):
+    received = modhost.received
+    latencies = []
+    commands = 0
+    start = time.monotonic()
+
+    for i in range(rounds):
+        if name == "pedalboard-load":
+            msgs = pedalboard_load_commands()
+            result = yield run_commands(host, msgs, bulk=True)
+        elif name == "snapshot-switch":
+            msgs = snapshot_switch_commands(value=i / rounds)
+            result = yield run_commands(host, msgs)
+        elif name == "knob-sweep":
+            msgs = knob_sweep_commands()
+            result = yield run_commands(host, msgs, spacing=0.001)
+        else:
+            msgs = recorded_commands(name)
+            result = yield run_commands(host, msgs)
+
+        commands += len(msgs)
+        latencies.extend(result)
+
+    elapsed = time.monotonic() - start
+    latencies.sort()
+
+    print("%-20s %7d cmds %7d sent %9.1f cmds/s   p50 %7.2fms  p90 %7.2fms  p99 %7.2fms  max %7.2fms" % (
+          os.path.basename(name), commands, modhost.received - received, commands / elapsed,
+          percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000,
+          percentile(latencies, 99) * 1000, latencies[-1] * 1000 if latencies else 0.0))
+
+@gen.coroutine
+def main(args):
+    verb_latency = {}
+    if args.verb_latency:
+        for item in args.verb_latency.split(","):
+            verb, latency = item.split("=", 1)
+            verb_latency[verb] = float(latency)
+
+    modhost = FakeModHost(args.port, args.latency, verb_latency)
+    modhost.start()
+
+    host = Host(FakeHMI(lambda: None), FakePreferences(), lambda msg: None)
+    host.addr = ("127.0.0.1", args.port)
+    if args.window:
+        host.pipeline_window = args.window
+
+    host.open_connection_if_needed(None)
+
+    while not host.connected:
+        yield gen.sleep(0.01)
+
+    # these need jack
+    host.statstimer.stop()
+    if host.memtimer is not None:
+        host.memtimer.stop()
+
+    print("pipeline window %d, mod-host latency %.2fms" % (host.pipeline_window, args.latency * 1000))
+
+    scenarios = list(SCENARIOS) if args.scenario == "all" else ([] if args.scenario == "none" else [args.scenario])
+    for name in scenarios + args.logs:
+        yield run_scenario(host, modhost, name, args.rounds)
+
+    modhost.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark mod-ui to mod-host communication")
+    parser.add_argument("logs", nargs="*", help="mod-ui logs to replay, recorded with MOD_LOG=1")
+    parser.add_argument("--scenario", default="all", choices=SCENARIOS + ("all", "none"))
+    parser.add_argument("--rounds", type=int, default=10, help="how many times to run each scenario")
+    parser.add_argument("--latency", type=float, default=0.0002, help="seconds mod-host takes per command")
+    parser.add_argument("--verb-latency", default="", help="per command latency, as verb=seconds,verb=seconds")
+    parser.add_argument("--window", type=int, default=0, help="pipeline window, defaults to MOD_HOST_PIPELINE_WINDOW")
+    parser.add_argument("--port", type=int, default=15555, help="port for the fake mod-host, port+1 is also used")
+
+    IOLoop.instance().run_sync(lambda: main(parser.parse_args()))